@@ -0,0 +1,159 @@
+from typing import Dict, Iterator, List, Optional
+
+# Pieces of the Azure DevOps export shared by the threaded engine
+# (fetch_workitems.py) and the asyncio engine (fetch_async.py). Nothing here
+# sends requests or reads the environment, so both can import it freely.
+
+MAX_IDS_PER_BATCH = 200  # workitemsbatch limit
+COMMENTS_API_VERSION = "7.1-preview.4"
+COMMENTS_PER_PAGE = 100
+
+# Fields build_record reads; nothing else is requested from ADO
+EXPORT_FIELDS = [
+    "System.Title",
+    "System.Description",
+    "Microsoft.VSTS.TCM.ReproSteps",
+    "Microsoft.VSTS.TCM.SystemInfo",
+    "Microsoft.VSTS.Common.AcceptanceCriteria",
+    "System.Tags",
+    "Microsoft.VSTS.Scheduling.StoryPoints",
+    "System.WorkItemType",
+    "System.State",
+    "System.AssignedTo",
+    "System.CreatedDate",
+    "System.ChangedDate",
+    "System.AreaPath",
+    "System.IterationPath",
+]
+# Hierarchy (parent/child) and artifact (commit) links; items with neither need no relations call
+LINK_COUNT_FIELDS = ["System.RelatedLinkCount", "System.ExternalLinkCount"]
+
+
+def id_batches(ids: List[int], size: int = MAX_IDS_PER_BATCH) -> Iterator[List[int]]:
+    for i in range(0, len(ids), size):
+        yield ids[i:i+size]
+
+
+def work_items_body(ids: List[int]) -> dict:
+    """
+    workitemsbatch body for up to MAX_IDS_PER_BATCH items, returning only
+    EXPORT_FIELDS. ADO does not allow a field list together with $expand,
+    so relations are requested in a second call (relations_body).
+    """
+    return {"ids": ids, "fields": EXPORT_FIELDS + LINK_COUNT_FIELDS, "errorPolicy": "Omit"}
+
+
+def relations_body(items: List[dict]) -> Optional[dict]:
+    """workitemsbatch body for the relations of the items whose link counts show they have any, or None."""
+    linked = [wi["id"] for wi in items if any(wi.get("fields", {}).get(f) for f in LINK_COUNT_FIELDS)]
+    if not linked:
+        return None
+    return {"ids": linked, "$expand": "Relations", "errorPolicy": "Omit"}
+
+
+def batch_values(payload: dict) -> List[dict]:
+    # errorPolicy Omit returns null for items that were deleted or are not visible
+    return [wi for wi in payload.get("value", []) if wi]
+
+
+def attach_relations(items: List[dict], related: List[dict]) -> List[dict]:
+    """Set each item's relations from the relations call (empty for items without links)."""
+    relations = {wi["id"]: wi.get("relations", []) for wi in related}
+    for wi in items:
+        wi["relations"] = relations.get(wi["id"], [])
+    return items
+
+
+def comments_params() -> dict:
+    return {"api-version": COMMENTS_API_VERSION, "$top": COMMENTS_PER_PAGE}
+
+
+def commitsbatch_request(base: str, repo: str, commit_ids: List[str], api_version: str) -> tuple:
+    """(url, params, body) of a commitsbatch call for commit_ids."""
+    return (f"{base}/_apis/git/repositories/{repo}/commitsbatch",
+            {"api-version": api_version, "$top": len(commit_ids)},
+            {"ids": commit_ids})
+
+
+def commit_url(base: str, repo: str, commit_id: str) -> str:
+    return f"{base}/_apis/git/repositories/{repo}/commits/{commit_id}"
+
+
+def batch_commits(payload: dict, commit_ids: List[str]) -> Dict[str, dict]:
+    """{commit id: details} for the requested commits in a commitsbatch response."""
+    return {c["commitId"]: c for c in payload.get("value", []) if c.get("commitId") in commit_ids}
+
+
+def classify_relations(relations: list) -> tuple:
+    """Split relations into (parents, children, commits, other_rels)."""
+    parents, children, commits, other_rels = [], [], [], []
+    for r in relations:
+        attrs = r.get("attributes", {}) or {}
+        name = (attrs.get("name") or "").lower()
+        url = r.get("url")
+        if "parent" in name:
+            parents.append(url)
+        elif "child" in name:
+            children.append(url)
+        elif url and ("/_apis/git/repositories/" in url and "/commits/" in url or "commit" in name or "fixed in" in name.lower()):
+            commits.append(url)
+        else:
+            other_rels.append({"rel": r.get("rel"), "url": url, "attributes": attrs})
+    return parents, children, commits, other_rels
+
+
+def commit_links(items: List[dict]) -> Iterator[str]:
+    """Commit relation URLs of a batch of work items, for CommitResolver."""
+    for wi in items:
+        yield from classify_relations(wi.get("relations", []))[2]
+
+
+def build_record(wi: dict, comments: list, resolved_commits: Dict[str, dict]) -> dict:
+    """
+    Assemble one export record from a work item JSON blob and its comments.
+    Classifies relations and attaches linked commit details, taken from
+    resolved_commits ({url: details}).
+    """
+    item_id = wi["id"]
+    fields = wi.get("fields", {})
+    parents, children, commits, _ = classify_relations(wi.get("relations", []))
+    commit_details = [resolved_commits.get(curl, {}) for curl in commits]
+
+    # Prefer normal description if it exists
+    description = fields.get("System.Description") or ""
+
+    # For Bugs (or items without description), fall back to Repro Steps + System Info
+    if not description:
+        repro = fields.get("Microsoft.VSTS.TCM.ReproSteps") or ""
+        sysinfo = fields.get("Microsoft.VSTS.TCM.SystemInfo") or ""
+        # Only build a synthetic description if there is actual content
+        bug_parts = []
+        if repro:
+            bug_parts.append(f"Repro Steps:\n{repro}")
+        if sysinfo:
+            bug_parts.append(f"System Info:\n{sysinfo}")
+        if bug_parts:
+            description = "\n\n".join(bug_parts)
+
+    return {
+        "id": item_id,
+        "rev": wi.get("rev"),
+        "title": fields.get("System.Title"),
+        "description": description,
+        "acceptance_criteria": fields.get("Microsoft.VSTS.Common.AcceptanceCriteria", ""),
+        "tags": fields.get("System.Tags", ""),
+        "story_points": fields.get("Microsoft.VSTS.Scheduling.StoryPoints", None),
+        "type": fields.get("System.WorkItemType"),
+        "state": fields.get("System.State"),
+        "assignedTo": (fields.get("System.AssignedTo") or {}).get("displayName"),
+        "createdDate": fields.get("System.CreatedDate"),
+        "changedDate": fields.get("System.ChangedDate"),
+        "areaPath": fields.get("System.AreaPath"),
+        "iterationPath": fields.get("System.IterationPath"),
+        "parents": parents,
+        "children": children,
+        "commit_links": commits,
+        "commit_details": commit_details,
+        "comments": comments,
+        "raw": wi
+    }
@@ -0,0 +1,116 @@
+"""
+Throughput of the fetch stage against the local mock ADO server.
+
+Starts benchmarks/mock_ado.py in-process with the given corpus, latency and
+throttling, runs `fetch_workitems.py --full` against it once per engine and
+reports wall time, items/sec, requests/sec (per endpoint too), retries
+caused by throttling, and the peak RSS of the fetch process. Extra
+fetcher settings can be passed with --set, e.g. --set COMMENT_WORKERS=16,
+and --json writes the results for comparison between runs.
+
+Usage: python benchmarks/bench_fetch.py [--items N] [--latency SECONDS] [--rate-limit RPS]
+                                        [--engine threads async] [--set KEY=VALUE ...] [--json PATH]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import peak_rss_mb
+from mock_ado import COMMENTS_PAGE_SIZE, MockAdo
+from records_io import iter_records
+
+
+def run_fetch(mock: MockAdo, engine: str, output: str, settings: dict) -> dict:
+    env = {k: v for k, v in os.environ.items() if k not in ("CHROMA_DIR", "SYNC_STATE", "DATE_FILE", "COMMIT_CACHE")}
+    env.update({
+        "ADO_API_BASE": mock.api_base,
+        "AZURE_DEVOPS_PAT": "benchmark",
+        # Measure the fetcher, not the client-side pacing, unless asked to
+        "ADO_REQUESTS_PER_SECOND": "100000",
+    })
+    env.update(settings)
+
+    before = dict(mock.stats)
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "fetch_workitems.py", "--full", "--raw", "omit", "--engine", engine, "--output", output],
+        cwd=REPO_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    log = proc.stdout.read()
+    # wait4 gives the child's own resource usage, unlike RUSAGE_CHILDREN
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        print(log)
+        raise SystemExit(f"fetch_workitems.py --engine {engine} exited with {proc.returncode}")
+
+    endpoints = {key: mock.stats[key] - before.get(key, 0) for key in mock.stats}
+    requests_sent = sum(count for key, count in endpoints.items() if key != "throttled")
+    records = sum(1 for _ in iter_records(output))
+    return {
+        "engine": engine,
+        "records": records,
+        "elapsed": round(elapsed, 3),
+        "items_per_sec": round(records / elapsed, 1),
+        "requests": requests_sent,
+        "requests_per_sec": round(requests_sent / elapsed, 1),
+        "endpoints": {key: count for key, count in sorted(endpoints.items()) if count},
+        "retries": log.count("  Retry "),
+        "peak_rss_mb": round(peak_rss_mb(rusage), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every mock response")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Mock requests per second before 429 (0: unlimited)")
+    parser.add_argument("--max-comments", type=int, default=5)
+    parser.add_argument("--comments-page-size", type=int, default=COMMENTS_PAGE_SIZE)
+    parser.add_argument("--description-bytes", type=int, default=0)
+    parser.add_argument("--commits", type=int, default=25, help="Distinct commits linked from work items")
+    parser.add_argument("--engine", nargs="+", choices=["threads", "async"], default=["threads"])
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE",
+                        help="Environment setting for fetch_workitems.py (repeatable)")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    settings = dict(item.split("=", 1) for item in args.set)
+    mock = MockAdo(args.items, args.latency, rate_limit=args.rate_limit, max_comments=args.max_comments,
+                   comments_page_size=args.comments_page_size, description_bytes=args.description_bytes,
+                   commits=args.commits).start()
+    limit = f", {args.rate_limit:g} req/s limit" if args.rate_limit else ""
+    print(f"{args.items} work items, {args.latency * 1000:.0f} ms latency{limit}"
+          f"{'  ' + ' '.join(args.set) if args.set else ''}\n")
+    print(f"{'engine':<8} {'time':>8} {'items/s':>8} {'req/s':>7} {'requests':>8} {'retries':>7} {'peak RSS':>9}")
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for engine in args.engine:
+                result = run_fetch(mock, engine, os.path.join(tmp, f"{engine}.ndjson"), settings)
+                results.append(result)
+                print(f"{engine:<8} {result['elapsed']:7.2f}s {result['items_per_sec']:8.1f} "
+                      f"{result['requests_per_sec']:7.1f} {result['requests']:8d} {result['retries']:7d} "
+                      f"{result['peak_rss_mb']:7.1f}MB")
+                print(f"         {result['endpoints']}")
+    finally:
+        mock.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": {**vars(args), "settings": settings}, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Compare stage artifact formats supported by records_io.
+
+Reads an existing export or cleaned artifact, rewrites it in every format
+(legacy .json, .ndjson, .ndjson.gz, .ndjson.zst, .msgpack), checks that
+each round-trips to the same records, and reports size, write time and
+read time. Formats whose optional package is missing are skipped.
+
+Usage: python benchmarks/bench_formats.py <artifact> [--repeat N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records_io import iter_records, write_records
+
+FORMATS = [".json", ".ndjson", ".ndjson.gz", ".ndjson.zst", ".msgpack"]
+
+
+def _best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare stage artifact formats")
+    parser.add_argument("artifact", help="Export or cleaned file in any supported format")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    records = list(iter_records(args.artifact))
+    print(f"{len(records)} records from {args.artifact}\n")
+    print(f"{'format':<12} {'size':>10} {'write':>9} {'read':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for ext in FORMATS:
+            path = os.path.join(tmp, "artifact" + ext)
+            try:
+                write_seconds = _best_of(lambda: write_records(path, records), args.repeat)
+            except RuntimeError as e:
+                print(f"{ext:<12} skipped: {e}")
+                continue
+            read_seconds = _best_of(lambda: sum(1 for _ in iter_records(path)), args.repeat)
+            assert list(iter_records(path)) == records, f"{ext} did not round-trip"
+            size_kb = os.path.getsize(path) / 1024
+            print(f"{ext:<12} {size_kb:>8.0f}KB {write_seconds * 1000:>7.1f}ms {read_seconds * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
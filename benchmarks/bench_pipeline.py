@@ -0,0 +1,182 @@
+"""
+End-to-end benchmark of the clean -> upload -> watermark stages.
+
+For each corpus size a synthetic export is generated with
+benchmarks/synth_corpus.py, then clean_workitems.py, upload_workitems.py
+(into a fresh Chroma directory) and get_last_date.py run on it as separate
+processes, as in the workflow. Each stage's wall time, throughput and peak
+RSS go into a JSON report. With --baseline, the report is compared against
+an earlier one and the run fails if any stage got slower or bigger than
+--tolerance allows, so regressions in clean_text, chunking or upsert show
+up.
+
+Uploads embed with a deterministic hash function by default, so the
+figures measure this code and Chroma's writes rather than the model; pass
+--embedder default to use the real embedding function.
+
+Usage: python benchmarks/bench_pipeline.py [--sizes 1000 10000 [100000]] [--report PATH]
+                                           [--baseline PATH] [--tolerance 0.2]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_utils import peak_rss_mb
+from records_io import iter_records, write_records
+from synth_corpus import generate_corpus
+
+STAGES = ["clean", "upload", "watermark"]
+# Differences below these are noise, whatever the ratio
+MIN_SECONDS_DELTA = 0.25
+MIN_RSS_DELTA_MB = 10.0
+
+# Runs upload_workitems.py with the default embedding function replaced by
+# 384-dimensional (like all-MiniLM-L6-v2) vectors derived from the text
+HASH_EMBEDDER_RUNNER = """
+import hashlib, runpy, sys
+import numpy as np
+from chromadb.utils import embedding_functions
+
+def _hash_embed(self, input):
+    return [
+        np.random.default_rng(int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little"))
+        .random(384, dtype=np.float32)
+        for text in input
+    ]
+
+embedding_functions.DefaultEmbeddingFunction.__call__ = _hash_embed
+sys.argv = ["upload_workitems.py"]
+runpy.run_path("upload_workitems.py", run_name="__main__")
+"""
+
+
+def run_stage(args: list, env: dict) -> tuple:
+    """Run one stage in its own process; returns (seconds, peak RSS in MB)."""
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable] + args, cwd=REPO_DIR, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    log = proc.stdout.read()
+    # wait4 gives the stage's own resource usage, unlike RUSAGE_CHILDREN
+    _, status, rusage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        print(log)
+        raise SystemExit(f"{args[-1] if args[0] == '-c' else args[0]} exited with {proc.returncode}")
+    return elapsed, peak_rss_mb(rusage)
+
+
+def bench_size(items: int, work_dir: str, embedder: str, clean_workers: int, seed: int) -> dict:
+    corpus = os.path.join(work_dir, f"workitems_{items}.ndjson")
+    cleaned = os.path.join(work_dir, f"workitems_{items}_cleaned.ndjson")
+    chroma_dir = os.path.join(work_dir, f"chroma_{items}")
+    start = time.perf_counter()
+    write_records(corpus, generate_corpus(items, seed))
+    print(f"{items} items: corpus generated in {time.perf_counter() - start:.1f}s")
+
+    env = {k: v for k, v in os.environ.items()
+           if k not in ("SYNC_STATE", "EMBEDDING_CACHE", "FULL_REBUILD", "UPSERT_BATCH_SIZE")}
+    env.update({
+        "WORKITEMS_FILE": corpus,
+        "CLEANED_FILE": cleaned,
+        "INPUT_FILE": cleaned,
+        "CHROMA_DIR": chroma_dir,
+        "DATE_FILE": os.path.join(work_dir, f"date_{items}.txt"),
+    })
+    upload = ["-c", HASH_EMBEDDER_RUNNER, "upload_workitems.py"] if embedder == "hash" else ["upload_workitems.py"]
+    commands = {
+        "clean": ["clean_workitems.py", "--workers", str(clean_workers)],
+        "upload": upload,
+        "watermark": ["get_last_date.py"],
+    }
+
+    results = {}
+    for stage in STAGES:
+        seconds, rss = run_stage(commands[stage], env)
+        results[stage] = {"seconds": round(seconds, 3), "items_per_sec": round(items / seconds, 1),
+                          "peak_rss_mb": round(rss, 1)}
+        if stage == "clean":
+            chunks = sum(1 for rec in iter_records(cleaned) if "embedding_text" in rec)
+        if stage in ("clean", "upload"):
+            results[stage]["chunks"] = chunks
+            results[stage]["chunks_per_sec"] = round(chunks / seconds, 1)
+        print(f"  {stage:<10} {seconds:8.2f}s {items / seconds:10.1f} items/s {rss:8.1f}MB peak RSS")
+    return results
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Print each stage against the baseline; return the regressions found."""
+    regressions = []
+    print(f"\nAgainst baseline from {baseline.get('created', '?')} (tolerance {tolerance:.0%}):")
+    for size, stages in report["results"].items():
+        for stage, current in stages.items():
+            base = baseline.get("results", {}).get(size, {}).get(stage)
+            if not base:
+                continue
+            time_ratio = current["seconds"] / base["seconds"] if base["seconds"] else 1.0
+            rss_ratio = current["peak_rss_mb"] / base["peak_rss_mb"] if base["peak_rss_mb"] else 1.0
+            slower = (time_ratio > 1 + tolerance and current["seconds"] - base["seconds"] > MIN_SECONDS_DELTA)
+            bigger = (rss_ratio > 1 + tolerance and current["peak_rss_mb"] - base["peak_rss_mb"] > MIN_RSS_DELTA_MB)
+            flag = "  REGRESSION" if slower or bigger else ""
+            print(f"  {size:>7} {stage:<10} time {time_ratio:5.2f}x  peak RSS {rss_ratio:5.2f}x{flag}")
+            if slower:
+                regressions.append(f"{stage} at {size} items: {base['seconds']:.2f}s -> {current['seconds']:.2f}s")
+            if bigger:
+                regressions.append(f"{stage} at {size} items: {base['peak_rss_mb']:.0f}MB -> {current['peak_rss_mb']:.0f}MB peak RSS")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Corpus sizes; add 100000 for the full suite (its upload takes tens of minutes)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedder", choices=["hash", "default"], default="hash")
+    parser.add_argument("--clean-workers", type=int, default=1)
+    parser.add_argument("--report", default="pipeline_report.json", help="JSON report to write")
+    parser.add_argument("--baseline", help="Earlier report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown / growth before failing")
+    parser.add_argument("--work-dir", help="Keep corpora, cleaned files and Chroma directories here")
+    args = parser.parse_args()
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "config": {"seed": args.seed, "embedder": args.embedder, "clean_workers": args.clean_workers},
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        # Stages run from the repository directory
+        work_dir = os.path.abspath(args.work_dir or tmp)
+        os.makedirs(work_dir, exist_ok=True)
+        for items in args.sizes:
+            report["results"][str(items)] = bench_size(items, work_dir, args.embedder, args.clean_workers, args.seed)
+
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print(f"Warning: baseline config {baseline.get('config')} differs from {report['config']}")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            raise SystemExit("Regressions:\n  " + "\n  ".join(regressions))
+        print("No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Exercise rate_limit.ThrottledSession against a local throttling server.
+
+The mock server allows --limit requests per second (sliding one-second
+window). Beyond that it answers 429 with Retry-After, reports
+X-RateLimit-* headers as the budget runs low, and fails a fraction of
+requests with a transient 503. The same concurrent workload is sent with a
+plain requests.Session and with ThrottledSession; the throttled client
+must finish every request successfully.
+
+Usage: python benchmarks/bench_rate_limit.py [--requests N] [--workers N] [--limit RPS]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+from bench_utils import RateWindow
+from rate_limit import ThrottledSession, TokenBucket
+
+
+def make_handler(limit: int, error_rate: float):
+    budget = RateWindow(limit)
+    lock = threading.Lock()
+    stats = {"ok": 0, "throttled": 0, "errors": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code: int, headers: dict = None):
+            body = json.dumps({"status": code}).encode("utf-8")
+            self.send_response(code)
+            for key, value in (headers or {}).items():
+                self.send_header(key, str(value))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            accepted, headers = budget.admit()
+            code = 429
+            if accepted:
+                code = 503 if random.random() < error_rate else 200
+            with lock:
+                stats["throttled" if code == 429 else "ok" if code == 200 else "errors"] += 1
+            self._send(code, headers)
+
+    return Handler, stats
+
+
+def run(session, url: str, n: int, workers: int) -> dict:
+    codes = {}
+    lock = threading.Lock()
+
+    def _get(i):
+        try:
+            code = session.get(f"{url}/item/{i}").status_code
+        except requests.RequestException as e:
+            code = type(e).__name__
+        with lock:
+            codes[code] = codes.get(code, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(_get, range(n)))
+    return {"elapsed": time.perf_counter() - start, "codes": codes}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=12)
+    parser.add_argument("--limit", type=int, default=50, help="Requests per second the server accepts")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Fraction of transient 503s")
+    args = parser.parse_args()
+
+    handler, stats = make_handler(args.limit, args.error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}"
+
+    plain = run(requests.Session(), url, args.requests, args.workers)
+    print(f"plain session:     {plain['elapsed']:.2f}s  {plain['codes']}")
+
+    stats.update(ok=0, throttled=0, errors=0)
+    # Start well above what the server allows so the bucket has to adapt
+    session = ThrottledSession(TokenBucket(args.limit * 4), max_retries=8, backoff_base=0.1)
+    throttled = run(session, url, args.requests, args.workers)
+    print(f"throttled session: {throttled['elapsed']:.2f}s  {throttled['codes']}  "
+          f"retries={session.retries}  final rate={session.bucket.rate:.1f}/s  server={stats}")
+    server.shutdown()
+
+    assert throttled["codes"] == {200: args.requests}, "throttled session did not complete every request"
+    print("OK: every request succeeded through the throttled session")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Helpers shared by the benchmark scripts and the mock servers they start."""
+import sys
+import threading
+import time
+from collections import deque
+from typing import Tuple
+
+
+def peak_rss_mb(rusage) -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return rusage.ru_maxrss / scale
+
+
+class RateWindow:
+    """
+    ADO-style request budget for mock servers: at most `limit` requests in
+    any sliding one-second window. Rejected requests don't use the budget.
+    """
+
+    def __init__(self, limit: float):
+        self.limit = limit
+        self.window = deque()
+        self.lock = threading.Lock()
+
+    def admit(self) -> Tuple[bool, dict]:
+        """
+        Count a request against the budget. Returns whether it is accepted
+        and the X-RateLimit-* headers to send, plus Retry-After if it isn't.
+        """
+        with self.lock:
+            now = time.monotonic()
+            while self.window and now - self.window[0] > 1.0:
+                self.window.popleft()
+            accepted = len(self.window) < self.limit
+            if accepted:
+                self.window.append(now)
+            headers = {
+                "X-RateLimit-Limit": f"{self.limit:g}",
+                "X-RateLimit-Remaining": f"{max(0, self.limit - len(self.window)):g}",
+            }
+        if not accepted:
+            headers["Retry-After"] = "1"
+        return accepted, headers
@@ -0,0 +1,231 @@
+"""
+Local mock of the Azure DevOps REST endpoints used by fetch_workitems.py.
+
+Serves WIQL, workitemsbatch (honouring the fields / $expand split), paged
+comments with continuation tokens, single commits and commitsbatch for a
+deterministic synthetic project. Corpus size and shape (items, comments per
+item, description size, distinct commits), a fixed latency added to every
+response, and ADO-style throttling (429 with Retry-After and X-RateLimit-*
+headers above a requests-per-second budget) are configurable. Requests are
+counted per endpoint. Point the exporter at it with ADO_API_BASE.
+
+Usage: python benchmarks/mock_ado.py [--items N] [--latency SECONDS] [--rate-limit RPS] [--port PORT]
+       then: ADO_API_BASE=http://127.0.0.1:PORT/org/project/_apis AZURE_DEVOPS_PAT=x python fetch_workitems.py --full
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from bench_utils import RateWindow
+
+REPOSITORY = "repo1"
+COMMENTS_PAGE_SIZE = 2
+
+
+class MockAdo:
+    """
+    Synthetic project of `items` work items; every response is delayed by
+    `latency` seconds. Item n has n % (max_comments + 1) comments, served
+    comments_page_size per page, and three in four items link one of
+    `commits` distinct commits. description_bytes pads each description to
+    roughly that size. With rate_limit > 0, requests beyond that many in
+    any one-second window are answered 429.
+    """
+
+    def __init__(self, items: int = 500, latency: float = 0.02, rate_limit: float = 0,
+                 max_comments: int = 5, comments_page_size: int = COMMENTS_PAGE_SIZE,
+                 description_bytes: int = 0, commits: int = 25):
+        self.items = items
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.max_comments = max_comments
+        self.comments_page_size = max(1, comments_page_size)
+        self.description_bytes = description_bytes
+        self.commits = max(1, commits)
+        self.requests = 0
+        # Requests answered per endpoint, plus "throttled" for 429s
+        self.stats = Counter()
+        self.budget = RateWindow(rate_limit) if rate_limit else None
+        self._lock = threading.Lock()
+        self.server = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}/org/project/_apis"
+
+    def work_item(self, item_id: int, host: str) -> dict:
+        has_commit = item_id % 4 != 0
+        relations = []
+        if has_commit:
+            relations.append({
+                "rel": "ArtifactLink",
+                "url": f"http://{host}/org/project/_apis/git/repositories/{REPOSITORY}/commits/c{item_id % self.commits}",
+                "attributes": {"name": "Fixed in Commit"},
+            })
+        description = (f"<div><p>Description of <b>item {item_id}</b> with a "
+                       f"<a href='https://example.com/{item_id}'>link</a>.</p></div>")
+        if self.description_bytes > len(description):
+            filler = f"<p>Steps to reproduce item {item_id}: open the page, click save, observe the error.</p>"
+            description += filler * ((self.description_bytes - len(description)) // len(filler) + 1)
+        return {
+            "id": item_id,
+            "rev": 3,
+            "fields": {
+                "System.Title": f"Work item {item_id}",
+                "System.Description": description,
+                "Microsoft.VSTS.Common.AcceptanceCriteria": "<ul><li>Works</li><li>Is tested</li></ul>",
+                "System.WorkItemType": "Bug" if item_id % 3 == 0 else "User Story",
+                "System.State": "Active",
+                "System.Tags": "mock; benchmark",
+                "System.AssignedTo": {"displayName": f"User {item_id % 7}"},
+                "System.CreatedDate": "2024-01-01T00:00:00Z",
+                "System.ChangedDate": f"2025-01-{item_id % 28 + 1:02d}T12:00:00Z",
+                "System.AreaPath": "project\\area",
+                "System.IterationPath": "project\\sprint 1",
+                "System.ExternalLinkCount": 1 if has_commit else 0,
+                "System.RelatedLinkCount": 0,
+                # Large field the exporter should never request
+                "System.History": "history " * 200,
+            },
+            "relations": relations,
+        }
+
+    def comments(self, item_id: int) -> list:
+        return [
+            {
+                "id": k,
+                "text": f"<p>Comment {k} on item {item_id}</p>",
+                "createdBy": {"displayName": f"User {k % 5}"},
+                "createdDate": "2025-01-01T10:00:00Z",
+                "modifiedDate": "2025-01-02T10:00:00Z",
+            }
+            for k in range(item_id % (self.max_comments + 1))
+        ]
+
+    def _admit(self, endpoint: str) -> dict:
+        """
+        Count a request against the rate limit. Returns the response headers
+        to send; they include Retry-After when the request must be rejected.
+        """
+        accepted, headers = self.budget.admit() if self.budget else (True, {})
+        with self._lock:
+            self.stats[endpoint if accepted else "throttled"] += 1
+        return headers
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so clients can reuse pooled connections
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, obj, code: int = 200, headers: dict = None):
+                time.sleep(mock.latency)
+                with mock._lock:
+                    mock.requests += 1
+                body = json.dumps(obj).encode("utf-8")
+                self.send_response(code)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _body(self) -> dict:
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _endpoint(self, path: str) -> str:
+                for suffix in ("/wit/wiql", "/wit/workitemsbatch", "/comments", "/commitsbatch"):
+                    if path.endswith(suffix):
+                        return suffix.rsplit("/", 1)[-1]
+                return "commit" if "/commits/" in path else "other"
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                body = self._body()
+                headers = mock._admit(self._endpoint(path))
+                if "Retry-After" in headers:
+                    return self._send({"message": "Request was blocked due to exceeding usage of resource."}, 429, headers)
+                if path.endswith("/wit/wiql"):
+                    return self._send({"workItems": [{"id": i} for i in range(1, mock.items + 1)]}, headers=headers)
+                if path.endswith("/wit/workitemsbatch"):
+                    if body.get("fields") and body.get("$expand"):
+                        return self._send({"message": "The expand parameter can not be used with the fields parameter."}, 400, headers)
+                    value = []
+                    for item_id in body.get("ids", []):
+                        wi = mock.work_item(item_id, self.headers["Host"])
+                        if body.get("fields"):
+                            wi["fields"] = {k: v for k, v in wi["fields"].items() if k in body["fields"]}
+                        if str(body.get("$expand", "")).lower() != "relations":
+                            wi.pop("relations")
+                        value.append(wi)
+                    return self._send({"count": len(value), "value": value}, headers=headers)
+                if path.endswith("/commitsbatch"):
+                    commits = [{"commitId": c, "comment": f"Fix for {c}"} for c in body.get("ids", [])]
+                    return self._send({"value": commits}, headers=headers)
+                self._send({"message": "not found"}, 404, headers)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                headers = mock._admit(self._endpoint(url.path))
+                if "Retry-After" in headers:
+                    return self._send({"message": "Request was blocked due to exceeding usage of resource."}, 429, headers)
+                if url.path.endswith("/comments"):
+                    item_id = int(url.path.split("/")[-2])
+                    comments = mock.comments(item_id)
+                    page_size = mock.comments_page_size
+                    start = int(query.get("continuationToken", ["0"])[0])
+                    page = {"comments": comments[start:start + page_size]}
+                    if start + page_size < len(comments):
+                        page["continuationToken"] = str(start + page_size)
+                    return self._send(page, headers=headers)
+                if "/commits/" in url.path:
+                    commit_id = url.path.split("/")[-1]
+                    return self._send({"commitId": commit_id, "comment": f"Fix for {commit_id}"}, headers=headers)
+                self._send({"message": "not found"}, 404, headers)
+
+        return Handler
+
+    def start(self, port: int = 0) -> "MockAdo":
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Azure DevOps server for fetch benchmarks")
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every response")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Requests per second before answering 429 (0: unlimited)")
+    parser.add_argument("--max-comments", type=int, default=5)
+    parser.add_argument("--comments-page-size", type=int, default=COMMENTS_PAGE_SIZE)
+    parser.add_argument("--description-bytes", type=int, default=0)
+    parser.add_argument("--commits", type=int, default=25, help="Distinct commits linked from work items")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    mock = MockAdo(args.items, args.latency, rate_limit=args.rate_limit, max_comments=args.max_comments,
+                   comments_page_size=args.comments_page_size, description_bytes=args.description_bytes,
+                   commits=args.commits).start(args.port)
+    print(f"Mock ADO serving {args.items} work items at {mock.api_base} (latency {args.latency * 1000:.0f} ms)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"Requests: {dict(mock.stats)}")
+        mock.stop()
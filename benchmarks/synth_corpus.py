@@ -0,0 +1,191 @@
+"""
+Deterministic synthetic work item corpus for pipeline benchmarks.
+
+Generates export records in the shape fetch_workitems.py writes (with
+--raw omit) and clean_workitems.prepare_embedding_text reads: HTML
+descriptions and acceptance criteria with mentions, LaTeX, inline code,
+images, attachment and plain links; markdown-format fields with tables
+(only plain text is flattened by markdown_table_to_sentences); and comment
+threads ranging from none to long discussions with multi-chunk comments.
+The same --items and --seed always give the same corpus.
+
+Usage: python benchmarks/synth_corpus.py --items N --output corpus.ndjson [--seed S]
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clean_workitems import MENTION_MAP
+from records_io import write_records
+
+WORDS = (
+    "assay compound plate storage registration pipeline sample batch result export import "
+    "threshold timeout validation schema migration permission role user report dashboard "
+    "query index cache service deploy release staging production error warning retry "
+    "latency throughput inventory barcode reagent instrument protocol audit review"
+).split()
+PEOPLE = ["Trinh, Spencer", "Genaro Scavello", "Min Wang", "Raul Leal", "Amy Crossan", "Dana Okafor", "Lee Park"]
+STATES = ["New", "Active", "Resolved", "Closed"]
+TAGS = ["backend", "frontend", "data", "infra", "regression", "customer", "security"]
+# Mentions the cleaner can resolve, plus ones it reports as [UNKNOWN]
+MENTION_IDS = list(MENTION_MAP) + ["11111111-2222-3333-4444-555555555555"]
+EPOCH_START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+
+def _sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _paragraph(rng: random.Random, sentences: int) -> str:
+    return " ".join(_sentence(rng, rng.randint(6, 18)) for _ in range(sentences))
+
+
+def _mention(rng: random.Random) -> str:
+    return f'<a href="#" data-vss-mention="version:2.0,{rng.randrange(10**6)}">@&lt;{rng.choice(MENTION_IDS)}&gt;</a>'
+
+
+def _table(rng: random.Random) -> str:
+    headers = rng.sample(["ISID", "ROLE", "COMPONENT", "STATUS", "OWNER", "COUNT"], 3)
+    rows = ["|" + "|".join(headers) + "|", "|" + "|".join("---" for _ in headers) + "|"]
+    for _ in range(rng.randint(2, 8)):
+        rows.append("|" + "|".join(rng.choice(WORDS).upper() for _ in headers) + "|")
+    return "\n".join(rows)
+
+
+def _markdown(rng: random.Random) -> str:
+    """A markdown-format field: plain text with a table, no HTML."""
+    return "\n".join([f"### {_sentence(rng, 4)}", _paragraph(rng, rng.randint(1, 3)), _table(rng),
+                      f"@<{rng.choice(MENTION_IDS)}> {_sentence(rng, 8)}"])
+
+
+def _latex(rng: random.Random) -> str:
+    symbol = rng.choice(["\\leq", "\\geq", "\\approx", "\\neq", "\\pm"])
+    if rng.random() < 0.5:
+        return f"$$IC_{{50}} {symbol} {rng.randint(1, 100)} \\text{{nM}}$$"
+    return f"${rng.choice(WORDS)} {symbol} {rng.randint(1, 9)} \\times baseline$"
+
+
+def _rich_block(rng: random.Random) -> str:
+    """One HTML block mixing the constructs clean_text handles."""
+    kind = rng.random()
+    if kind < 0.15:
+        # Pipe rows pasted into an HTML field stay on one line
+        return "<p>" + _table(rng).replace("\n", "<br>") + "</p>"
+    if kind < 0.25:
+        return f"<p>{_sentence(rng, 8)} Target: {_latex(rng)}</p>"
+    if kind < 0.35:
+        return (f"<p>See [the runbook](https://dev.azure.com/org/project/_wiki/wikis/ops/{rng.randint(1, 99)}) "
+                f"and https://example.com/status?id={rng.randint(1, 9999)} for details.</p>")
+    if kind < 0.42:
+        return (f"<p>![screenshot](https://dev.azure.com/org/_apis/wit/attachments/{rng.randint(1, 9999)}"
+                f"?fileName=shot{rng.randint(1, 99)}.png)</p>")
+    if kind < 0.50:
+        return f"<p>Run <code>`make {rng.choice(WORDS)}`</code> before merging &gt; release. <b>**Note:**</b> ---</p>"
+    if kind < 0.60:
+        return f"<p>Hi {_mention(rng)}, {_paragraph(rng, 1).lower()}</p>"
+    if kind < 0.75:
+        items = "".join(f"<li>{_sentence(rng, rng.randint(4, 10))}</li>" for _ in range(rng.randint(2, 6)))
+        return f"<ul>{items}</ul>"
+    return f"<p>{_paragraph(rng, rng.randint(1, 5))}</p>"
+
+
+def _html(rng: random.Random, blocks: int) -> str:
+    return "<div>" + "".join(_rich_block(rng) for _ in range(blocks)) + "</div>"
+
+
+def _comment_count(rng: random.Random) -> int:
+    # Most items have a few comments; some have long threads
+    roll = rng.random()
+    if roll < 0.3:
+        return 0
+    if roll < 0.85:
+        return rng.randint(1, 5)
+    if roll < 0.97:
+        return rng.randint(6, 25)
+    return rng.randint(26, 80)
+
+
+def _comment(rng: random.Random, k: int, created: datetime) -> dict:
+    if rng.random() < 0.1:
+        # Long enough to be split into several comment chunks
+        text = _html(rng, rng.randint(12, 30))
+    elif rng.random() < 0.1:
+        text = _markdown(rng)
+    elif rng.random() < 0.4:
+        text = f"<div>{_mention(rng)} {_rich_block(rng)}</div>"
+    else:
+        text = f"<div>{_paragraph(rng, rng.randint(1, 3))}</div>"
+    modified = created + timedelta(minutes=rng.randint(0, 600))
+    return {
+        "id": k + 1,
+        "text": text,
+        "createdBy": {"displayName": rng.choice(PEOPLE)},
+        "createdDate": _iso(created),
+        "modifiedDate": _iso(modified),
+    }
+
+
+def generate_workitem(item_id: int, seed: int = 0) -> dict:
+    """Export record for one synthetic work item; depends only on item_id and seed."""
+    rng = random.Random(f"{seed}:{item_id}")
+    created = EPOCH_START + timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+    changed = created + timedelta(minutes=rng.randint(0, 90 * 24 * 60))
+    # A few very long descriptions exceed MAX_CHUNK_WORDS
+    blocks = rng.randint(20, 60) if rng.random() < 0.05 else rng.randint(1, 8)
+
+    comments, when = [], created
+    for k in range(_comment_count(rng)):
+        when += timedelta(minutes=rng.randint(5, 3000))
+        comments.append(_comment(rng, k, when))
+
+    return {
+        "id": item_id,
+        "rev": rng.randint(1, 30),
+        "title": _sentence(rng, rng.randint(4, 10)).rstrip("."),
+        "description": _markdown(rng) if rng.random() < 0.1 else _html(rng, blocks),
+        "acceptance_criteria": _html(rng, rng.randint(1, 3)) if rng.random() < 0.6 else "",
+        "tags": "; ".join(rng.sample(TAGS, rng.randint(0, 3))),
+        "story_points": rng.choice([None, 1, 2, 3, 5, 8]),
+        "type": "Bug" if rng.random() < 0.4 else "User Story",
+        "state": rng.choice(STATES),
+        "assignedTo": rng.choice(PEOPLE + [None]),
+        "createdDate": _iso(created),
+        "changedDate": _iso(changed),
+        "areaPath": "project\\area",
+        "iterationPath": f"project\\sprint {rng.randint(1, 40)}",
+        "parents": [],
+        "children": [],
+        "commit_links": [],
+        "commit_details": [],
+        "comments": comments,
+    }
+
+
+def generate_corpus(items: int, seed: int = 0) -> Iterator[dict]:
+    for item_id in range(1, items + 1):
+        yield generate_workitem(item_id, seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="Export file to write (.ndjson, .json, .gz, ...)")
+    args = parser.parse_args()
+
+    written = write_records(args.output, generate_corpus(args.items, args.seed))
+    print(f"Wrote {written} synthetic work items to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,20 @@
-import json
+import argparse
+import hashlib
 import re
 import os
+from itertools import islice
+from multiprocessing import Pool
 from datetime import datetime
 from pathlib import Path
-from bs4 import BeautifulSoup
+from typing import Iterable, Iterator
+from html_text import html_to_text
+from metrics import METRICS, stage_report
+from profiling import profile_stage
+from records_io import iter_records, split_ext, write_records
 
 MAX_CHUNK_WORDS = 500
 COMMENT_CHUNK_WORDS = 200  # finer-grained chunks for comments
+CLEAN_CHUNKSIZE = 16  # work items sent to a worker process per task
 
 # Mapping of DevOps mentions to human-readable names
 MENTION_MAP = {
@@ -17,10 +25,48 @@ MENTION_MAP = {
     "CEBDFF88-616E-665A-BF1A-B85A0CBB30EE": "Amy Crossan",
 }
 
+# Patterns used by clean_text, compiled once at import time
+MENTION_OR_AT_RE = re.compile(r'@<([\w-]+)>|@')
+IMAGE_RE = re.compile(r'!\[.*?\]\(.*?\)')
+MARKDOWN_LINK_RE = re.compile(r'\[([^\]]+)\]\((https?://[^\)]+)\)')
+URL_RE = re.compile(r'https?://\S+')
+HORIZONTAL_RULE_RE = re.compile(r'\n?-{3,}\n?')
+LATEX_BLOCK_RE = re.compile(r'\$\$(.+?)\$\$', re.DOTALL)
+LATEX_INLINE_RE = re.compile(r'\$(.+?)\$')
+LATEX_TEXT_RE = re.compile(r'\\text\{(.+?)\}')
+INLINE_CODE_RE = re.compile(r'`(.+?)`')
+DASH_RULE_RE = re.compile(r'---+')
+
+# Common LaTeX symbols and their plain-text equivalents
+LATEX_SYMBOLS = {
+    "leq": "<=",
+    "geq": ">=",
+    "times": "*",
+    "cdot": "*",
+    "pm": "+/-",
+    "neq": "!=",
+    "approx": "~",
+    "to": "->",
+}
+# Alternation order matches the dict order, so "\\times" wins over "\\to"
+LATEX_SYMBOL_RE = re.compile(r'\\(' + "|".join(LATEX_SYMBOLS) + r')')
+
+# JSON-like braces and extra markdown symbols, deleted outright
+MARKDOWN_SYMBOLS = "{}*#>"
+
 def replace_mention(match):
     mention_id = match.group(1)
     return MENTION_MAP.get(mention_id, "[UNKNOWN]")
 
+def _replace_mention_or_at(match):
+    # A bare "@" has no group and is dropped
+    if match.group(1) is None:
+        return ""
+    return replace_mention(match)
+
+def _replace_latex_symbol(match):
+    return LATEX_SYMBOLS[match.group(1)]
+
 def markdown_table_to_sentences(text: str) -> str:
     """
     Convert markdown tables into natural language sentences for embeddings.
@@ -58,22 +104,22 @@ def replace_file_links(text: str) -> str:
             return f"[FILE: {file_name}]"
         else:
             return f"{link_text}"  # keep readable text
-    return re.sub(r'\[([^\]]+)\]\((https?://[^\)]+)\)', repl, text)
+    return MARKDOWN_LINK_RE.sub(repl, text)
 
 def replace_markdown_links(text: str) -> str:
     """Replace markdown links [text](url) with [LINK: text] placeholders."""
     def repl(match):
         link_text = match.group(1).strip()
         return f"[LINK: {link_text}]"
-    return re.sub(r'\[([^\]]+)\]\((https?://[^\)]+)\)', repl, text)
+    return MARKDOWN_LINK_RE.sub(repl, text)
 
 def replace_urls(text: str) -> str:
     """Replace remaining raw URLs with [LINK]."""
-    return re.sub(r'https?://\S+', '[LINK]', text)
+    return URL_RE.sub('[LINK]', text)
 
 def remove_horizontal_rules(text: str) -> str:
     """Remove Markdown horizontal rules (`---`)."""
-    return re.sub(r'\n?-{3,}\n?', ' ', text)
+    return HORIZONTAL_RULE_RE.sub(' ', text)
 
 def strip_latex_math(text: str) -> str:
     """
@@ -81,9 +127,9 @@ def strip_latex_math(text: str) -> str:
     keeping the math content inside.
     """
     # Remove $$...$$ blocks
-    text = re.sub(r'\$\$(.+?)\$\$', r'\1', text, flags=re.DOTALL)
+    text = LATEX_BLOCK_RE.sub(r'\1', text)
     # Remove inline $...$ blocks
-    text = re.sub(r'\$(.+?)\$', r'\1', text)
+    text = LATEX_INLINE_RE.sub(r'\1', text)
     return text
 
 def clean_text(text: str) -> str:
@@ -91,66 +137,82 @@ def clean_text(text: str) -> str:
     if not text:
         return ""
     
-    # Convert HTML entities to text
-    text = BeautifulSoup(text, "html.parser").get_text(separator=" ")
+    # Convert HTML and entities to text (skips parsing for plain strings)
+    text = html_to_text(text)
+
+    return normalize_text(text)
 
-    # Replace mentions, and replace @ symbols
-    text = re.sub(
-        r'@',
-        '',
-        re.sub(r'@<([\w-]+)>', replace_mention, text)
-    )
+def normalize_text(text: str) -> str:
+    """
+    Normalize plain text extracted from HTML: mentions, images, tables, links,
+    math, code and markdown symbols. Every pattern is precompiled, and
+    substitutions that can't interact are merged into single passes.
+    """
+    # Each pass is skipped when its trigger characters are absent, which is
+    # the common case for short comments
+
+    # Replace mentions and drop remaining @ symbols in one pass
+    if "@" in text:
+        text = MENTION_OR_AT_RE.sub(_replace_mention_or_at, text)
 
     # Replace markdown images
-    text = re.sub(r'!\[.*?\]\(.*?\)', '[IMAGE]', text)
+    if "![" in text:
+        text = IMAGE_RE.sub('[IMAGE]', text)
 
     # Flatten markdown tables
-    text = markdown_table_to_sentences(text)
+    if "|" in text:
+        text = markdown_table_to_sentences(text)
 
-    # Replace markdown links with [LINK: text]
-    text = replace_markdown_links(text)
+    if "://" in text:
+        # Replace markdown links with [LINK: text]
+        text = replace_markdown_links(text)
 
-    # Replace remaining raw URLs
-    text = replace_urls(text)
+        # Replace remaining raw URLs
+        text = replace_urls(text)
 
     # Remove horizontal rules
-    text = remove_horizontal_rules(text)
+    if "---" in text:
+        text = remove_horizontal_rules(text)
 
     # Strip LaTeX math $$...$$
-    text = strip_latex_math(text)
-
-    # Replace common LaTeX symbols with plain-text equivalents
-    latex_symbols = {
-        r'\\leq': '<=',
-        r'\\geq': '>=',
-        r'\\times': '*',
-        r'\\cdot': '*',
-        r'\\pm': '+/-',
-        r'\\neq': '!=',
-        r'\\approx': '~',
-        r'\\to': '->',
-    }
-    for k, v in latex_symbols.items():
-        text = re.sub(k, v, text)
-
-    # Remove \text{...} commands but keep content
-    text = re.sub(r'\\text\{(.+?)\}', r'\1', text)
-    # Remove inline code markers and extra symbols
-    text = re.sub(r'`(.+?)`', r'\1', text)
+    if "$" in text:
+        text = strip_latex_math(text)
 
-    # Remove JSON-like braces that are not meaningful
-    text = re.sub(r'[{}]', '', text)
+    if "\\" in text:
+        # Replace common LaTeX symbols with plain-text equivalents
+        text = LATEX_SYMBOL_RE.sub(_replace_latex_symbol, text)
+
+        # Remove \text{...} commands but keep content
+        text = LATEX_TEXT_RE.sub(r'\1', text)
+
+    # Remove inline code markers and extra symbols
+    if "`" in text:
+        text = INLINE_CODE_RE.sub(r'\1', text)
 
-    # Remove extra markdown symbols
-    text = re.sub(r'\*+|\#+|>', '', text)
+    # Remove JSON-like braces and extra markdown symbols
+    for symbol in MARKDOWN_SYMBOLS:
+        if symbol in text:
+            text = text.replace(symbol, "")
 
     # Remove markdown horizontal rules "---"
-    text = re.sub(r'---+', ' ', text)
+    if "---" in text:
+        text = DASH_RULE_RE.sub(' ', text)
 
     # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    return " ".join(text.split())
 
-    return text
+def content_hash(text: str) -> str:
+    """Stable hash of a chunk's embedding text, used to skip re-embedding unchanged chunks."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def to_epoch(value: str) -> int:
+    """
+    Seconds since the epoch for an ADO ISO timestamp, or 0 if missing.
+    Stored as an int so the watermark lookup can use Chroma's (key, int_value) index.
+    """
+    if not value:
+        return 0
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp())
 
 def chunk_text(text: str, max_words: int) -> list:
     """Split text into chunks of approximately max_words each."""
@@ -163,6 +225,8 @@ def chunk_text(text: str, max_words: int) -> list:
 def prepare_embedding_text(workitem: dict) -> list:
     """
     Convert workitem fields into embedding-ready text chunks with metadata.
+    - The first record holds the item-level details (cleaned description and
+      acceptance criteria), stored once per item instead of on every chunk
     - Main text (title, description, acceptance criteria) is chunked together
     - Each comment is chunked separately at COMMENT_CHUNK_WORDS
     """
@@ -185,8 +249,22 @@ def prepare_embedding_text(workitem: dict) -> list:
     if acceptance:
         parts.append(acceptance)
 
+    # Item-level details, resolved back onto chunks at query time
+    records.append({
+        "id": workitem.get("id"),
+        "rev": workitem.get("rev"),
+        "changedDate": workitem.get("changedDate"),
+        "details": {
+            "workItemId": workitem.get("id"),
+            "title": title,
+            "description": description,
+            "acceptance_criteria": acceptance
+        }
+    })
+
     # Join all into one blob
     full_text = "\n".join(parts)
+    changed_epoch = to_epoch(workitem.get("changedDate"))
 
     # Chunk the main text
     for idx, chunk in enumerate(chunk_text(full_text, max_words=MAX_CHUNK_WORDS)):
@@ -195,17 +273,18 @@ def prepare_embedding_text(workitem: dict) -> list:
             "chunk_index": idx,
             "embedding_text": chunk,
             "metadata": {
+                "workItemId": workitem.get("id"),
+                "contentHash": content_hash(chunk),
                 "title": title,
                 "section": "main",
-                "description": description,
-                "acceptance_criteria": acceptance,
                 "type": workitem.get("type"),
                 "state": workitem.get("state"),
                 "assignedTo": workitem.get("assignedTo") or "",
                 "storyPoints": workitem.get("story_points") or 0,
                 "tags": workitem.get("tags") or "",
                 "createdDate": workitem.get("createdDate", ""),
-                "changedDate": workitem.get("changedDate", "")
+                "changedDate": workitem.get("changedDate", ""),
+                "changedEpoch": changed_epoch
             }
         })
 
@@ -226,15 +305,16 @@ def prepare_embedding_text(workitem: dict) -> list:
 
         # Chunk each comment separately
         for jdx, chunk in enumerate(chunk_text(text, max_words=COMMENT_CHUNK_WORDS)):
+            embedding_text = f"{author} commented on ({date}): {chunk}"
             records.append({
                 "id": workitem.get("id"),
                 "chunk_index": f"c{idx}_{jdx}",  # distinguish comment chunks
-                "embedding_text": f"{author} commented on ({date}): {chunk}",
+                "embedding_text": embedding_text,
                 "metadata": {
+                    "workItemId": workitem.get("id"),
+                    "contentHash": content_hash(embedding_text),
                     "title": title,
                     "section": "comment",
-                    "description": description,
-                    "acceptance_criteria": acceptance,
                     "author": author,
                     "createdDate": date,
                     "modifiedDate": mod_date, 
@@ -242,35 +322,69 @@ def prepare_embedding_text(workitem: dict) -> list:
                     "state": workitem.get("state"),
                     "assignedTo": workitem.get("assignedTo") or "",
                     "storyPoints": workitem.get("story_points") or 0,
-                    "tags": workitem.get("tags") or ""
+                    "tags": workitem.get("tags") or "",
+                    "changedEpoch": changed_epoch
                 }
             })
 
     return records
 
-def process_workitems(input_file: str, output_file: str = None) -> list:
-    """Load, clean, chunk workitems, and return list ready for vector embedding."""
+def iter_cleaned_records(workitems: Iterable[dict], workers: int = 1, chunksize: int = CLEAN_CHUNKSIZE) -> Iterator[dict]:
+    """
+    Yield embedding-ready chunk records for each workitem, in input order.
+    With workers > 1 the items are cleaned in a process pool, a bounded
+    window at a time; output is identical to the serial path.
+    """
+    if workers <= 1:
+        for wi in workitems:
+            # prepare_embedding_text now returns a list of full records
+            yield from prepare_embedding_text(wi)
+        return
+
+    workitems = iter(workitems)
+    window = workers * chunksize * 4
+    with Pool(processes=workers) as pool:
+        while True:
+            group = list(islice(workitems, window))
+            if not group:
+                break
+            for records in pool.imap(prepare_embedding_text, group, chunksize=chunksize):
+                yield from records
+
+def process_workitems(input_file: str, output_file: str = None, workers: int = 1) -> int:
+    """
+    Stream workitems from input_file, clean and chunk them, and write the
+    records to output_file (if given). Returns the number of records produced.
+    """
     input_path = Path(input_file)
-    if not input_path.is_file():
+    if not input_path.exists():
         raise FileNotFoundError(f"{input_file} not found")
 
-    with open(input_file, "r", encoding="utf-8") as f:
-        workitems = json.load(f)
-
-    processed_records = []
-    for wi in workitems:
-        # prepare_embedding_text now returns a list of full records
-        processed_records.extend(prepare_embedding_text(wi))
-
+    records = _count_records(iter_cleaned_records(iter_records(input_file), workers=workers))
     if output_file:
-        with open(output_file, "w", encoding="utf-8") as f:
-            json.dump(processed_records, f, indent=2, ensure_ascii=False)
-
-    return processed_records
+        return write_records(output_file, records)
+    return sum(1 for _ in records)
+
+def _count_records(records: Iterable[dict]) -> Iterator[dict]:
+    """Count items and chunks as they are written (in this process, whatever the worker count)."""
+    for rec in records:
+        if "details" in rec:
+            METRICS.incr("workitems_cleaned_total")
+        else:
+            METRICS.incr("chunks_produced_total", section=rec["metadata"]["section"])
+            METRICS.incr("embedding_text_chars_total", len(rec["embedding_text"]))
+        yield rec
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clean and chunk exported work items for embedding")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("CLEAN_WORKERS", "1")),
+                        help="Number of worker processes (env: CLEAN_WORKERS, default 1)")
+    args = parser.parse_args()
+
     in_path = os.getenv("WORKITEMS_FILE")
-    out_path = f"{in_path.split('.')[0]}_cleaned.json"
-    processed = process_workitems(in_path, out_path)
-    print(f"Processed {len(processed)} workitems from {out_path}")
+    base, ext = split_ext(in_path)
+    out_path = os.getenv("CLEANED_FILE") or f"{base}_cleaned{ext}"
+    with stage_report("clean"), profile_stage("clean"):
+        processed = process_workitems(in_path, out_path, workers=args.workers)
+    print(f"Processed {processed} records into {out_path}")
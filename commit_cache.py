@@ -0,0 +1,144 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ado_api import batch_commits, commit_url, commitsbatch_request
+from sqlite_utils import connect_shared, in_batches
+
+# commitsbatch returns at most $top commits per call
+COMMITS_PER_BATCH = 100
+
+# <base>/_apis/git/repositories/<repo>/commits/<commit id>
+COMMIT_URL_RE = re.compile(r"^(?P<base>.+?)/_apis/git/repositories/(?P<repo>[^/]+)/commits/(?P<commit>[^/?#]+)")
+
+
+def parse_commit_url(url: str) -> Optional[Tuple[str, str, str]]:
+    """Return (base url, repository, commit id) for a Git commit API URL, or None."""
+    match = COMMIT_URL_RE.match(url or "")
+    if not match:
+        return None
+    return match.group("base"), match.group("repo"), match.group("commit")
+
+
+class CommitCache:
+    """
+    Commit details stored in a single SQLite file, keyed by repository and
+    commit id. Commits are immutable, so entries are never invalidated and
+    the file can be carried between workflow runs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = connect_shared(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS commits (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, dict]:
+        found = {}
+        for placeholders, batch in in_batches(keys):
+            rows = self.conn.execute(f"SELECT key, data FROM commits WHERE key IN ({placeholders})", batch)
+            found.update((key, json.loads(data)) for key, data in rows)
+        return found
+
+    def put_many(self, items: Dict[str, dict]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO commits (key, data) VALUES (?, ?)",
+            [(key, json.dumps(data)) for key, data in items.items()]
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class CommitResolver:
+    """
+    Resolves commit relation URLs to commit details. Each commit is fetched
+    at most once per run (memoized in memory) and, with a CommitCache, at
+    most once ever. Misses are grouped by repository and fetched with the
+    commitsbatch API, one request per COMMITS_PER_BATCH ids, concurrently;
+    any commit the batch call doesn't return is fetched individually.
+    """
+
+    def __init__(self, session, api_version: str, cache: Optional[CommitCache] = None, max_workers: int = 4):
+        self.session = session
+        self.api_version = api_version
+        self.cache = cache
+        self.max_workers = max(1, max_workers)
+        self.memo: Dict[str, dict] = {}
+        self.fetched = 0
+        self.cache_hits = 0
+
+    def _fetch_batch(self, base: str, repo: str, commit_ids: List[str]) -> Dict[str, dict]:
+        url, params, body = commitsbatch_request(base, repo, commit_ids, self.api_version)
+        r = self.session.post(url, params=params, json=body)
+        found = batch_commits(r.json(), commit_ids) if r.ok else {}
+        for commit_id in commit_ids:
+            if commit_id not in found:
+                single = self.session.get(commit_url(base, repo, commit_id), params={"api-version": self.api_version})
+                if single.ok:
+                    found[commit_id] = single.json()
+        return self._keyed(repo, found)
+
+    @staticmethod
+    def _keyed(repo: str, found: Dict[str, dict]) -> Dict[str, dict]:
+        return {f"{repo}/{commit_id}": data for commit_id, data in found.items()}
+
+    def _plan(self, urls: List[str], in_flight: Iterable[str] = ()) -> Tuple[dict, set, List[tuple]]:
+        """
+        Parse urls and look them up in memory and in the cache. Returns
+        ({url: (base, repo, commit id, key)}, keys still missing,
+        [(base, repo, commit ids)] batch jobs that would fetch them).
+        Keys in in_flight are being fetched elsewhere and are left out.
+        """
+        keys = {}
+        for url in urls:
+            parsed = parse_commit_url(url)
+            if parsed:
+                base, repo, commit_id = parsed
+                keys[url] = (base, repo, commit_id, f"{repo}/{commit_id}")
+
+        missing = {key for _, _, _, key in keys.values() if key not in self.memo and key not in in_flight}
+        if missing and self.cache:
+            cached = self.cache.get_many(list(missing))
+            self.cache_hits += len(cached)
+            self.memo.update(cached)
+            missing -= cached.keys()
+
+        groups: Dict[Tuple[str, str], List[str]] = {}
+        grouped = set()
+        for base, repo, commit_id, key in keys.values():
+            if key in missing and key not in grouped:
+                grouped.add(key)
+                groups.setdefault((base, repo), []).append(commit_id)
+        jobs = [
+            (base, repo, ids[i:i+COMMITS_PER_BATCH])
+            for (base, repo), ids in groups.items()
+            for i in range(0, len(ids), COMMITS_PER_BATCH)
+        ]
+        return keys, missing, jobs
+
+    def _store(self, urls: List[str], keys: dict, missing: set, fetched: Dict[str, dict]) -> Dict[str, dict]:
+        self.fetched += len(fetched)
+        if self.cache and fetched:
+            self.cache.put_many(fetched)
+        self.memo.update(fetched)
+        # Remember failures for this run only
+        for key in missing - fetched.keys():
+            self.memo[key] = {}
+        return self._lookup(urls, keys)
+
+    def _lookup(self, urls: List[str], keys: dict) -> Dict[str, dict]:
+        return {url: self.memo.get(keys[url][3], {}) if url in keys else {} for url in urls}
+
+    def resolve(self, urls: Iterable[str]) -> Dict[str, dict]:
+        """Return {url: commit details} for urls; URLs that aren't commits or can't be fetched map to {}."""
+        urls = list(dict.fromkeys(urls))
+        keys, missing, jobs = self._plan(urls)
+        fetched = {}
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+                for result in pool.map(lambda job: self._fetch_batch(*job), jobs):
+                    fetched.update(result)
+        return self._store(urls, keys, missing, fetched)
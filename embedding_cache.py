@@ -0,0 +1,72 @@
+import hashlib
+import sqlite3
+from array import array
+from typing import Callable, Dict, List
+
+from sqlite_utils import in_batches
+
+
+class EmbeddingCache:
+    """
+    Persistent on-disk cache of embedding vectors stored in a single SQLite file.
+    Entries are keyed by a hash of the model identifier plus the exact text,
+    so a changed model never returns stale vectors. The file can be carried
+    between workflow runs to avoid recomputing embeddings for unchanged text.
+    """
+
+    def __init__(self, path: str, model_id: str):
+        self.path = path
+        self.model_id = model_id
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self.conn.commit()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for placeholders, batch in in_batches(keys):
+            rows = self.conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+            )
+            for key, blob in rows:
+                found[key] = array("f", blob).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, array("f", vector).tobytes()) for key, vector in items.items()]
+        )
+        self.conn.commit()
+
+    def embed(self, texts: List[str], embedding_func: Callable) -> List[List[float]]:
+        """
+        Return one vector per text, computing only the ones not already cached
+        (each distinct text is embedded at most once) and storing them.
+        """
+        keys = [self.key(t) for t in texts]
+        found = self.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.hits += len(texts) - sum(1 for k in keys if k in missing)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = embedding_func(list(missing.values()))
+            computed = {key: [float(x) for x in vec] for key, vec in zip(missing, vectors)}
+            self.put_many(computed)
+            found.update(computed)
+
+        return [found[k] for k in keys]
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,302 @@
+import asyncio
+import queue
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import httpx
+
+from ado_api import (
+    attach_relations,
+    batch_commits,
+    batch_values,
+    build_record,
+    commit_links,
+    comments_params,
+    commit_url,
+    commitsbatch_request,
+    id_batches,
+    relations_body,
+    work_items_body,
+)
+from commit_cache import CommitCache, CommitResolver
+from metrics import METRICS
+from rate_limit import RETRY_STATUSES, RetryPolicy, TokenBucket
+from sync_state import SyncState
+
+_DONE = object()
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class AsyncAdoClient(RetryPolicy):
+    """
+    httpx.AsyncClient wrapper with the same RetryPolicy as
+    rate_limit.ThrottledSession: a shared TokenBucket, Retry-After and
+    X-RateLimit-* handling, and jittered exponential backoff on 429/5xx
+    and connection errors. Every request it sends is a read, so all are retried.
+    """
+
+    def __init__(self, api_base: str, pat: str, api_version: str, bucket: TokenBucket,
+                 max_retries: int = 5, max_connections: int = 32,
+                 backoff_base: float = 0.5, backoff_max: float = 60.0):
+        super().__init__(bucket, max_retries, backoff_base, backoff_max, retry_methods=("GET", "POST"))
+        self.api_base = api_base
+        self.api_version = api_version
+        self.client = httpx.AsyncClient(
+            auth=("", pat),
+            http2=_http2_available(),
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(60.0),
+        )
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempt = 0
+        while True:
+            waited = time.perf_counter()
+            delay = self.bucket.reserve()
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = self.bucket.reserve()
+            start = time.perf_counter()
+            METRICS.observe("rate_limit_wait_seconds", start - waited)
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                delay = self.delay_after_error(method, attempt, start, e)
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+            else:
+                delay = self.delay_after_response(method, attempt, start, response.status_code, response.headers,
+                                                  response.is_success, len(response.content))
+                if delay is None:
+                    return response
+                reason = str(response.status_code)
+
+            attempt += 1
+            self.count_retry(method, url, attempt, delay, reason)
+            await asyncio.sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+
+async def _post_work_items_batch(client: AsyncAdoClient, body: dict) -> List[dict]:
+    url = f"{client.api_base}/wit/workitemsbatch"
+    r = await client.request("POST", url, params={"api-version": client.api_version}, json=body)
+    r.raise_for_status()
+    return batch_values(r.json())
+
+
+async def get_work_item_batch(client: AsyncAdoClient, chunk: List[int]) -> List[dict]:
+    """Async counterpart of fetch_workitems._get_work_item_batch."""
+    items = await _post_work_items_batch(client, work_items_body(chunk))
+    body = relations_body(items)
+    return attach_relations(items, await _post_work_items_batch(client, body) if body else [])
+
+
+async def get_comments(client: AsyncAdoClient, item_id: int) -> list:
+    """Async counterpart of fetch_workitems.get_comments."""
+    url = f"{client.api_base}/wit/workItems/{item_id}/comments"
+    params = comments_params()
+    all_comments = []
+    while True:
+        r = await client.request("GET", url, params=params)
+        if r.status_code in RETRY_STATUSES:
+            # Still throttled after all retries: fail rather than export the item without comments
+            r.raise_for_status()
+        if not r.is_success:
+            print(f"Warning: Failed to fetch comments for {item_id}: {r.status_code}")
+            break
+
+        data = r.json()
+        all_comments.extend(data.get("comments", []))
+
+        token = data.get("continuationToken")
+        if token:
+            params["continuationToken"] = token
+        else:
+            break
+
+    METRICS.incr("comments_fetched_total", len(all_comments))
+    return all_comments
+
+
+class AsyncCommitResolver(CommitResolver):
+    """
+    CommitResolver whose commitsbatch calls are awaited concurrently on the
+    event loop. Detail batches resolve their commits concurrently, so a
+    commit another batch is already fetching is awaited, not fetched again,
+    and max_concurrency bounds the requests of all batches together.
+    """
+
+    def __init__(self, client: AsyncAdoClient, cache: Optional[CommitCache] = None, max_concurrency: int = 4):
+        super().__init__(None, client.api_version, cache=cache, max_workers=max_concurrency)
+        self.client = client
+        self.slots = asyncio.Semaphore(self.max_workers)
+        # key -> future set once the aresolve call fetching that commit has stored it
+        self.pending: Dict[str, asyncio.Future] = {}
+
+    async def _fetch_batch_async(self, base: str, repo: str, commit_ids: List[str]) -> Dict[str, dict]:
+        """Async counterpart of CommitResolver._fetch_batch."""
+        url, params, body = commitsbatch_request(base, repo, commit_ids, self.api_version)
+        r = await self.client.request("POST", url, params=params, json=body)
+        found = batch_commits(r.json(), commit_ids) if r.is_success else {}
+        for commit_id in commit_ids:
+            if commit_id not in found:
+                single = await self.client.request("GET", commit_url(base, repo, commit_id),
+                                                   params={"api-version": self.api_version})
+                if single.is_success:
+                    found[commit_id] = single.json()
+        return self._keyed(repo, found)
+
+    async def _run(self, job: tuple) -> Dict[str, dict]:
+        async with self.slots:
+            return await self._fetch_batch_async(*job)
+
+    async def aresolve(self, urls) -> Dict[str, dict]:
+        urls = list(dict.fromkeys(urls))
+        keys, missing, jobs = self._plan(urls, in_flight=self.pending)
+        waiting = {self.pending[key] for _, _, _, key in keys.values() if key in self.pending}
+        loop = asyncio.get_running_loop()
+        owned = {key: loop.create_future() for key in missing}
+        self.pending.update(owned)
+        try:
+            fetched = {}
+            for result in await asyncio.gather(*(self._run(job) for job in jobs)):
+                fetched.update(result)
+            self._store(urls, keys, missing, fetched)
+        finally:
+            # Waiters read the memo; on failure they find nothing, like a failed fetch
+            for key, future in owned.items():
+                del self.pending[key]
+                future.set_result(None)
+        if waiting:
+            await asyncio.gather(*waiting)
+        return self._lookup(urls, keys)
+
+
+async def aiter_export_records(ids: List[int], client: AsyncAdoClient, state: Optional[SyncState] = None,
+                               commits: Optional[AsyncCommitResolver] = None, max_batches: int = 4,
+                               comment_concurrency: int = 32):
+    """
+    Yield export records batch by batch. Up to max_batches detail batches
+    are in flight; as each arrives its comments (at most
+    comment_concurrency requests across all batches) and commits are
+    fetched while the other batches are still loading. Batches are yielded
+    in completion order, not WIQL order.
+    """
+    commits = commits or AsyncCommitResolver(client)
+    comment_slots = asyncio.Semaphore(comment_concurrency)
+    total, done, skipped = len(ids), 0, 0
+
+    async def _comments(item_id: int) -> list:
+        async with comment_slots:
+            return await get_comments(client, item_id)
+
+    async def _export_batch(chunk: List[int]) -> tuple:
+        batch = await get_work_item_batch(client, chunk)
+        fetched = len(batch)
+        if state is not None:
+            known = state.get_revs(wi["id"] for wi in batch)
+            batch = [wi for wi in batch if wi.get("rev") is None or known.get(wi["id"]) != wi.get("rev")]
+        all_comments, resolved = await asyncio.gather(
+            asyncio.gather(*(_comments(wi["id"]) for wi in batch)),
+            commits.aresolve(commit_links(batch)),
+        )
+        return fetched, [build_record(wi, comments, resolved) for wi, comments in zip(batch, all_comments)]
+
+    chunks = id_batches(ids)
+    pending = {asyncio.create_task(_export_batch(chunk)) for _, chunk in zip(range(max(1, max_batches)), chunks)}
+    try:
+        while pending:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.add(asyncio.create_task(_export_batch(chunk)))
+                fetched, records = task.result()
+                done += fetched
+                skipped += fetched - len(records)
+                METRICS.incr("workitems_unchanged_total", fetched - len(records))
+                for rec in records:
+                    yield rec
+                print(f"Exported {done}/{total} work items ({skipped} unchanged since last sync)")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def iter_export_records_async(ids: List[int], api_base: str, pat: str, api_version: str, bucket: TokenBucket,
+                              max_retries: int = 5, state: Optional[SyncState] = None,
+                              commit_cache: Optional[CommitCache] = None, max_batches: int = 4,
+                              comment_concurrency: int = 32, commit_concurrency: int = 4,
+                              queue_size: int = 1000) -> Iterator[dict]:
+    """
+    Export records from the asyncio engine (fetch_workitems.py --engine async),
+    as a plain iterator for write_records. Detail batches, comment paging and
+    commit resolution run as concurrent tasks over one pooled httpx client
+    (HTTP/2 when `h2` is installed) and records are built with the same
+    build_record as the threaded engine. The event loop runs in a background
+    thread; at most queue_size records wait in the hand-off queue, so a slow
+    writer holds back fetching.
+    """
+    records: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                records.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    async def _produce():
+        loop = asyncio.get_running_loop()
+        client = AsyncAdoClient(api_base, pat, api_version, bucket, max_retries=max_retries,
+                                max_connections=comment_concurrency + max_batches + commit_concurrency)
+        try:
+            commits = AsyncCommitResolver(client, cache=commit_cache, max_concurrency=commit_concurrency)
+            async for rec in aiter_export_records(ids, client, state, commits, max_batches, comment_concurrency):
+                try:
+                    records.put_nowait(rec)
+                except queue.Full:
+                    # Wait for the writer off the loop thread so in-flight requests keep going
+                    if not await loop.run_in_executor(None, _put, rec):
+                        return
+            print(f"Commits: {commits.fetched} fetched, {commits.cache_hits} from cache")
+            METRICS.incr("commits_fetched_total", commits.fetched)
+            METRICS.incr("commit_cache_hits_total", commits.cache_hits)
+        finally:
+            await client.aclose()
+
+    def _run():
+        try:
+            asyncio.run(_produce())
+            _put(_DONE)
+        except BaseException as e:
+            _put(e)
+
+    thread = threading.Thread(target=_run, name="fetch-async", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = records.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
@@ -1,23 +1,72 @@
+import argparse
+import glob
 import os
 import requests
 import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
-from typing import Iterable, List, Union
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+from requests.adapters import HTTPAdapter
+from ado_api import (
+    attach_relations,
+    batch_values,
+    build_record,
+    comments_params,
+    commit_links,
+    id_batches,
+    relations_body,
+    work_items_body,
+)
+from commit_cache import CommitCache, CommitResolver
+from metrics import METRICS, stage_report
+from profiling import profile_stage
+from raw_store import RawStore, raw_store_path
+from rate_limit import RETRY_STATUSES, ThrottledSession, TokenBucket
+from records_io import is_ndjson, write_records
+from sync_state import SYNC_STATE_FILE, SyncState
 
 ORG_NAME = os.getenv("AZURE_DEVOPS_ORG")
 PROJECT_NAME = os.getenv("AZURE_DEVOPS_PROJECT")
-API_BASE = f"https://dev.azure.com/{ORG_NAME}/{PROJECT_NAME}/_apis"
+# ADO_API_BASE points the export at another server, e.g. a local mock for benchmarks
+API_BASE = os.getenv("ADO_API_BASE") or f"https://dev.azure.com/{ORG_NAME}/{PROJECT_NAME}/_apis"
 API_VERSION = "7.0"
 
 PAT = os.getenv("AZURE_DEVOPS_PAT")
 if not PAT:
     raise RuntimeError("Please set AZURE_DEVOPS_PAT in env")
 
-SESSION = requests.Session()
+COMMENT_WORKERS = int(os.getenv("COMMENT_WORKERS", "8"))
+DETAIL_WORKERS = int(os.getenv("DETAIL_WORKERS", "4"))
+COMMIT_WORKERS = int(os.getenv("COMMIT_WORKERS", "4"))
+# Concurrent comment requests in the async engine (it needs no thread per request)
+ASYNC_COMMENT_CONCURRENCY = int(os.getenv("ASYNC_COMMENT_CONCURRENCY", "32"))
+# SQLite cache of commit details (see commit_cache.CommitCache); unset: no cache
+COMMIT_CACHE = os.getenv("COMMIT_CACHE")
+# Starting request rate shared by all workers; lowered automatically when ADO throttles
+ADO_REQUESTS_PER_SECOND = float(os.getenv("ADO_REQUESTS_PER_SECOND", "20"))
+# Ceiling the rate probes up to while responses show headroom (default: 10x the starting rate)
+ADO_MAX_REQUESTS_PER_SECOND = float(os.getenv("ADO_MAX_REQUESTS_PER_SECOND", "0")) or None
+ADO_MAX_RETRIES = int(os.getenv("ADO_MAX_RETRIES", "5"))
+
+# Watermark written by get_last_date.py; used for incremental syncs
+DATE_FILE = os.getenv("DATE_FILE")
+# Ledger maintained by upload_workitems.py; items whose rev it already has are skipped
+CHROMA_DIR = os.getenv("CHROMA_DIR")
+SYNC_STATE = os.getenv("SYNC_STATE") or (os.path.join(CHROMA_DIR, SYNC_STATE_FILE) if CHROMA_DIR else None)
+
+# The only POSTs (WIQL, workitemsbatch) are read-only queries, so they are retried too
+SESSION = ThrottledSession(
+    TokenBucket(ADO_REQUESTS_PER_SECOND, max_rate=ADO_MAX_REQUESTS_PER_SECOND),
+    max_retries=ADO_MAX_RETRIES,
+    retry_methods=("GET", "POST"),
+)
 SESSION.auth = ("", PAT)
 SESSION.headers.update({"Content-Type": "application/json"})
-
-MAX_IDS_PER_BATCH = 200
+# Size the connection pool so concurrent workers reuse keep-alive connections
+_ADAPTER = HTTPAdapter(pool_connections=1, pool_maxsize=max(COMMENT_WORKERS + DETAIL_WORKERS + COMMIT_WORKERS, 10))
+SESSION.mount("https://", _ADAPTER)
+SESSION.mount("http://", _ADAPTER)
 
 
 def run_wiql(query: str) -> dict:
@@ -27,6 +76,36 @@ def run_wiql(query: str) -> dict:
     return r.json()
 
 
+def read_watermark(path: Optional[str]) -> Optional[str]:
+    """
+    Read the FILTERED_DATE watermark (YYYY-MM-DD) written by get_last_date.py.
+    Returns None when the file is missing or empty.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        value = f.read().strip()
+    return value or None
+
+
+def build_wiql(since: Optional[str] = None) -> str:
+    """
+    Build the export WIQL. When since is given, only items changed on or
+    after that date are returned.
+    """
+    date_clause = ""
+    if since:
+        # Validate before interpolating into the query
+        since = datetime.fromisoformat(since).date().isoformat()
+        date_clause = f"\n    AND [System.ChangedDate] >= '{since}'"
+    return f"""
+    SELECT [System.Id], [System.Title], [System.ChangedDate]
+    FROM WorkItems
+    WHERE [System.TeamProject] = '{PROJECT_NAME}'{date_clause}
+    ORDER BY [System.ChangedDate] DESC
+    """
+
+
 def _ensure_id_list(ids_or_id: Union[int, str, Iterable[int]]) -> List[int]:
     if isinstance(ids_or_id, (int, str)):
         return [int(ids_or_id)]
@@ -35,46 +114,80 @@ def _ensure_id_list(ids_or_id: Union[int, str, Iterable[int]]) -> List[int]:
     raise TypeError("ids_or_id must be int or iterable of ints")
 
 
-def _chunks(lst: List[int], n: int):
-    for i in range(0, len(lst), n):
-        yield lst[i:i+n]
+def _post_work_items_batch(body: dict) -> List[dict]:
+    url = f"{API_BASE}/wit/workitemsbatch?api-version={API_VERSION}"
+    r = SESSION.post(url, json=body)
+    r.raise_for_status()
+    return batch_values(r.json())
+
+
+def _get_work_item_batch(chunk: List[int]) -> List[dict]:
+    """
+    Fetch up to MAX_IDS_PER_BATCH work items with their export fields, plus
+    a second call for the relations of the items that have links.
+    """
+    items = _post_work_items_batch(work_items_body(chunk))
+    body = relations_body(items)
+    return attach_relations(items, _post_work_items_batch(body) if body else [])
 
 
-def get_work_item_details(ids_or_id: Union[int, Iterable[int]]) -> List[dict]:
+def get_work_item_details(ids_or_id: Union[int, Iterable[int]], max_workers: int = DETAIL_WORKERS) -> List[dict]:
     """
     Returns a list of work item JSON blobs. Accepts a single id or a list.
-    Will chunk large lists into batches (<= MAX_IDS_PER_BATCH).
-    Expands 'relations'.
+    Will chunk large lists into batches (<= MAX_IDS_PER_BATCH) and fetch up to
+    max_workers batches concurrently, keeping the input order.
+    Only the export fields and relations are returned.
     """
     ids = _ensure_id_list(ids_or_id)
+    chunks = list(id_batches(ids))
     all_values = []
-    for chunk in _chunks(ids, MAX_IDS_PER_BATCH):
-        params = {
-            "ids": ",".join(map(str, chunk)),
-            "$expand": "relations",
-            "api-version": API_VERSION,
-        }
-        url = f"{API_BASE}/wit/workitems"
-        r = SESSION.get(url, params=params)
-        r.raise_for_status()
-        data = r.json()
-        all_values.extend(data.get("value", []))
+    if max_workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            all_values.extend(_get_work_item_batch(chunk))
+        return all_values
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for values in pool.map(_get_work_item_batch, chunks):
+            all_values.extend(values)
     return all_values
 
 
+def iter_work_item_details(ids_or_id: Union[int, Iterable[int]], max_workers: int = DETAIL_WORKERS) -> Iterator[List[dict]]:
+    """
+    Streaming variant of get_work_item_details.
+    Yields each batch of work item JSON blobs as soon as it arrives, so callers
+    can start downstream work before every batch is done. Batches are yielded
+    in completion order, not input order. At most max_workers batches are in
+    flight, so a slow consumer doesn't pile up fetched batches in memory.
+    """
+    ids = _ensure_id_list(ids_or_id)
+    chunks = id_batches(ids)
+    max_workers = max(1, max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # range first: zip stops on it without pulling (and dropping) one more chunk
+        pending = {pool.submit(_get_work_item_batch, chunk) for _, chunk in zip(range(max_workers), chunks)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.add(pool.submit(_get_work_item_batch, chunk))
+                yield fut.result()
+
+
 def get_comments(item_id: int) -> list:
     """
     Fetches all comments for a work item using the comments API (requires preview API version).
     Uses continuationToken from the response body to page through results.
     """
     url = f"{API_BASE}/wit/workItems/{item_id}/comments"
-    params = {
-        "api-version": "7.1-preview.4",
-        "$top": 100
-    }
+    params = comments_params()
     all_comments = []
     while True:
         r = SESSION.get(url, params=params)
+        if r.status_code in RETRY_STATUSES:
+            # Still throttled after all retries: fail rather than export the item without comments
+            r.raise_for_status()
         try:
             r.raise_for_status()
         except requests.HTTPError:
@@ -90,130 +203,283 @@ def get_comments(item_id: int) -> list:
         else:
             break
 
+    METRICS.incr("comments_fetched_total", len(all_comments))
     return all_comments
 
 
-def fetch_linked_commit_if_any(rel_url: str) -> dict:
+def get_comments_for_items(item_ids: Iterable[int], max_workers: int = COMMENT_WORKERS, total: Optional[int] = None) -> List[list]:
     """
-    If a relation URL looks like a Git commit artifact, fetch it.
+    Fetches comments for many work items concurrently over the shared SESSION.
+    Each item pages through its own continuationToken inside get_comments.
+    item_ids may be a generator: fetches are submitted as ids are produced.
+    Returns one comment list per id, in the same order as item_ids.
     """
-    if "/_apis/git/repositories/" in rel_url and "/commits/" in rel_url:
-        r = SESSION.get(rel_url, params={"api-version": API_VERSION})
-        if r.ok:
-            return r.json()
-    return {}
+    if total is None:
+        item_ids = list(item_ids)
+        total = len(item_ids)
+    done = 0
+    lock = threading.Lock()
+
+    def _fetch(item_id: int) -> list:
+        nonlocal done
+        comments = get_comments(item_id)
+        with lock:
+            done += 1
+            print(f"  [{done}/{total}] Work item {item_id}: {len(comments)} comments")
+        return comments
 
+    if max_workers <= 1:
+        return [_fetch(item_id) for item_id in item_ids]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(_fetch, item_ids))
+
+
+def iter_export_records(ids: List[int], state: Optional[SyncState] = None,
+                        commits: Optional[CommitResolver] = None) -> Iterator[dict]:
+    """
+    Yields export records batch by batch. Comments for each detail batch are
+    fetched concurrently as soon as the batch arrives, so only a few batches
+    of work items are held in memory at a time. Batches are yielded in
+    completion order, not WIQL order. Items whose rev matches the sync state
+    ledger are already indexed and are skipped before fetching comments.
+    The commits linked from a batch are resolved together, each one once.
+    """
+    commits = commits or CommitResolver(SESSION, API_VERSION, max_workers=COMMIT_WORKERS)
+    done = skipped = 0
+    for batch in iter_work_item_details(ids):
+        done += len(batch)
+        if state is not None:
+            known = state.get_revs(wi["id"] for wi in batch)
+            changed = [wi for wi in batch if wi.get("rev") is None or known.get(wi["id"]) != wi.get("rev")]
+            skipped += len(batch) - len(changed)
+            METRICS.incr("workitems_unchanged_total", len(batch) - len(changed))
+            batch = changed
+        all_comments = get_comments_for_items([wi["id"] for wi in batch])
+        resolved = commits.resolve(commit_links(batch))
+        for wi, comments in zip(batch, all_comments):
+            yield build_record(wi, comments, resolved)
+        print(f"Exported {done}/{len(ids)} work items ({skipped} unchanged since last sync)")
+
+
+CHECKPOINT_SUFFIX = ".checkpoint"
+
+
+def save_checkpoint(output_file: str, since: Optional[str], ids: List[int], full: bool = False) -> None:
+    """
+    Record the export's work item ids next to its output file, so --resume
+    finishes the same set of items even if the WIQL results have moved on.
+    """
+    tmp = f"{output_file}{CHECKPOINT_SUFFIX}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"since": since, "full": full, "ids": ids}, f)
+    os.replace(tmp, output_file + CHECKPOINT_SUFFIX)
+
+
+def load_checkpoint(output_file: str) -> Optional[dict]:
+    path = output_file + CHECKPOINT_SUFFIX
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_latest_checkpoint(pattern: str = "workitems_export_*.ndjson") -> Optional[str]:
+    """Return the output file of the most recent checkpointed export in the working directory."""
+    checkpoints = glob.glob(pattern + CHECKPOINT_SUFFIX)
+    if not checkpoints:
+        return None
+    return max(checkpoints, key=os.path.getmtime)[:-len(CHECKPOINT_SUFFIX)]
+
+
+def recover_completed_ids(output_file: str) -> set:
+    """
+    Return the ids of the records fully written to a partial NDJSON export.
+    Every line is one finished work item; a torn last line left by a crash
+    is truncated so appended records start on a clean line.
+    """
+    completed = set()
+    if not os.path.exists(output_file):
+        return completed
+    good_bytes = 0
+    with open(output_file, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                completed.add(json.loads(line)["id"])
+            except (ValueError, KeyError):
+                break
+            good_bytes += len(line)
+    with open(output_file, "r+b") as f:
+        f.truncate(good_bytes)
+    return completed
+
+
+def recover_raw_store(output_file: str, completed: set) -> Tuple[RawStore, set]:
+    """
+    Reopen the raw side file of a resumed export, keeping the blobs of its
+    completed records. Records whose blob was lost (side files written
+    before every put was flushed) are dropped from the export so they are
+    fetched again; returns the store and the ids still completed.
+    """
+    refs = {}
+    # The checkpoint is saved before the export file is created
+    if os.path.exists(output_file):
+        with open(output_file, encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec.get("raw_ref"):
+                    refs[rec["id"]] = rec["raw_ref"]
+    raw_store = RawStore(raw_store_path(output_file), keep=refs.values())
+    lost = {item_id for item_id, ref in refs.items() if ref not in raw_store.seen}
+    if lost:
+        tmp = output_file + ".tmp"
+        with open(output_file, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+            for line in src:
+                if json.loads(line)["id"] not in lost:
+                    dst.write(line)
+        os.replace(tmp, output_file)
+        print(f"Raw JSON of {len(lost)} exported work items was lost; fetching them again")
+    return raw_store, completed - lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Azure DevOps work items to JSON")
+    parser.add_argument("--full", action="store_true", default=os.getenv("FULL_REBUILD") == "1",
+                        help="Ignore the watermark and export every work item (env: FULL_REBUILD=1)")
+    parser.add_argument("--since", default=None,
+                        help="Only export items changed on or after this date (YYYY-MM-DD); overrides DATE_FILE")
+    parser.add_argument("--output", default=os.getenv("EXPORT_FILE"),
+                        help="Output file; the format follows the extension (.ndjson, .ndjson.gz, .ndjson.zst, .msgpack, .json) "
+                             "(default: workitems_export_<timestamp>.ndjson)")
+    parser.add_argument("--raw", choices=["sidecar", "inline", "omit"], default=os.getenv("EXPORT_RAW", "sidecar"),
+                        help="Where the raw work item JSON goes: a gzip side file referenced by raw_ref "
+                             "(default), inline in each record, or nowhere (env: EXPORT_RAW)")
+    parser.add_argument("--engine", choices=["threads", "async"], default=os.getenv("FETCH_ENGINE", "threads"),
+                        help="threads: requests + thread pools; async: asyncio + httpx (env: FETCH_ENGINE)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Finish an interrupted export from its checkpoint (default: the latest one in this directory)")
+    args = parser.parse_args()
 
-if __name__ == "__main__":
     print("=" * 70)
     print("Azure DevOps Work Items Export")
     print("=" * 70)
-    
-    # Build WIQL query with date filter
-    WIQL = f"""
-    SELECT [System.Id], [System.Title], [System.ChangedDate]
-    FROM WorkItems
-    WHERE [System.TeamProject] = '{PROJECT_NAME}'
-    ORDER BY [System.ChangedDate] DESC
-    """
-    
-    print(f"\nExecuting WIQL query...\n{WIQL}")
-    wiql_res = run_wiql(WIQL)
-    ids = [w["id"] for w in wiql_res.get("workItems", [])]
-    print(f"Found {len(ids)} work items to process")
 
-    if not ids:
-        print("\n✓ No work items found. Exiting.")
-        print("NO_NEW_ITEMS=1")
-        exit(0)
-
-    work_items = get_work_item_details(ids)
-    print(f"Retrieved details for {len(work_items)} work items")
-
-    # Assemble records
-    records = []
-    for i, wi in enumerate(work_items, 1):
-        item_id = wi["id"]
-        fields = wi.get("fields", {})
-        relations = wi.get("relations", [])
-        
-        # Classify relations
-        parents, children, commits, other_rels = [], [], [], []
-        for r in relations:
-            attrs = r.get("attributes", {}) or {}
-            name = (attrs.get("name") or "").lower()
-            url = r.get("url")
-            if "parent" in name:
-                parents.append(url)
-            elif "child" in name:
-                children.append(url)
-            elif url and ("/_apis/git/repositories/" in url and "/commits/" in url or "commit" in name or "fixed in" in name.lower()):
-                commits.append(url)
+    output_file = args.output
+    checkpoint = None
+    if args.resume:
+        output_file = output_file or find_latest_checkpoint()
+        checkpoint = load_checkpoint(output_file) if output_file else None
+        if checkpoint is None:
+            print("No checkpoint found, starting a new export")
+    output_file = output_file or f"workitems_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.ndjson"
+
+    completed = set()
+    if checkpoint:
+        args.full, since, ids = checkpoint["full"], checkpoint["since"], checkpoint["ids"]
+        completed = recover_completed_ids(output_file)
+        print(f"Resuming {output_file}: {len(completed)}/{len(ids)} work items already exported")
+    else:
+        since = None
+        if not args.full:
+            since = args.since or read_watermark(DATE_FILE)
+            if since:
+                print(f"Incremental sync: items changed since {since}")
             else:
-                other_rels.append({"rel": r.get("rel"), "url": url, "attributes": attrs})
-
-        # Fetch comments
-        print(f"  [{i}/{len(work_items)}] Processing work item {item_id}...", end="")
-        comments = get_comments(item_id)
-        print(f" {len(comments)} comments")
-        
-        # Fetch commit details
-        commit_details = [fetch_linked_commit_if_any(curl) for curl in commits]
-        wi_type = fields.get("System.WorkItemType", "")  # "Bug" or "User Story"
-
-        # Prefer normal description if it exists
-        description = fields.get("System.Description") or ""
-
-        # For Bugs (or items without description), fall back to Repro Steps + System Info
-        if not description:
-            repro = fields.get("Microsoft.VSTS.TCM.ReproSteps") or ""
-            sysinfo = fields.get("Microsoft.VSTS.TCM.SystemInfo") or ""
-            # Only build a synthetic description if there is actual content
-            bug_parts = []
-            if repro:
-                bug_parts.append(f"Repro Steps:\n{repro}")
-            if sysinfo:
-                bug_parts.append(f"System Info:\n{sysinfo}")
-            if bug_parts:
-                description = "\n\n".join(bug_parts)
-
-        record = {
-            "id": item_id,
-            "title": fields.get("System.Title"),
-            "description": description,
-            "acceptance_criteria": fields.get("Microsoft.VSTS.Common.AcceptanceCriteria", ""),
-            "tags": fields.get("System.Tags", ""),
-            "story_points": fields.get("Microsoft.VSTS.Scheduling.StoryPoints", None),
-            "type": fields.get("System.WorkItemType"),
-            "state": fields.get("System.State"),
-            "assignedTo": (fields.get("System.AssignedTo") or {}).get("displayName"),
-            "createdDate": fields.get("System.CreatedDate"),
-            "changedDate": fields.get("System.ChangedDate"),
-            "areaPath": fields.get("System.AreaPath"),
-            "iterationPath": fields.get("System.IterationPath"),
-            "parents": parents,
-            "children": children,
-            "commit_links": commits,
-            "commit_details": commit_details,
-            "comments": comments,
-            "raw": wi
-        }
-        records.append(record)
-
-    # Save to JSON (TEMP)
-    output_file = f"workitems_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(records, f, indent=2, ensure_ascii=False)
-    
-    print(f"\n✅ Exported work items to {output_file}")
-
-    # logic to upload newest records into chroma db
+                print("No watermark found, falling back to a full export")
+        else:
+            print("Full rebuild: exporting every work item")
+
+        # Build WIQL query with date filter
+        WIQL = build_wiql(since)
+
+        print(f"\nExecuting WIQL query...\n{WIQL}")
+        wiql_res = run_wiql(WIQL)
+        ids = [w["id"] for w in wiql_res.get("workItems", [])]
+        print(f"Found {len(ids)} work items to process")
+        METRICS.set("workitems_queried", len(ids))
+
+        if not ids:
+            print("\n✓ No work items found. Exiting.")
+            print("NO_NEW_ITEMS=1")
+            exit(0)
+
+    # Checkpoint plain NDJSON files; pipes, compressed and legacy .json outputs can't be resumed
+    resumable = is_ndjson(output_file) and (not os.path.exists(output_file) or os.path.isfile(output_file))
+    if resumable and not checkpoint:
+        save_checkpoint(output_file, since, ids, args.full)
+
+    raw_store = None
+    if args.raw == "sidecar":
+        if checkpoint:
+            raw_store, completed = recover_raw_store(output_file, completed)
+        else:
+            raw_store = RawStore(raw_store_path(output_file))
+    remaining = [i for i in ids if i not in completed]
+
+    print(f"Fetching details with {DETAIL_WORKERS} workers and comments with {COMMENT_WORKERS} workers...")
+
+    # Records are written as they are produced; keep the first one as a sample
+    samples = []
+
+    def _keep_sample(records):
+        for rec in records:
+            if not samples:
+                samples.append(rec)
+            yield rec
+
+    def _handle_raw(records):
+        for rec in records:
+            if args.raw != "inline":
+                raw = rec.pop("raw")
+                if raw_store:
+                    rec["raw_ref"] = raw_store.put(raw)
+            yield rec
+
+    # A full rebuild re-exports everything regardless of the ledger
+    state = None
+    if not args.full and SYNC_STATE and os.path.exists(SYNC_STATE):
+        state = SyncState(SYNC_STATE)
+        print(f"Skipping items already indexed at their current rev (ledger: {SYNC_STATE})")
+
+    commit_cache = CommitCache(COMMIT_CACHE) if COMMIT_CACHE else None
+    if args.engine == "async":
+        from fetch_async import iter_export_records_async
+        records = iter_export_records_async(
+            remaining, API_BASE, PAT, API_VERSION,
+            TokenBucket(ADO_REQUESTS_PER_SECOND, max_rate=ADO_MAX_REQUESTS_PER_SECOND),
+            max_retries=ADO_MAX_RETRIES, state=state, commit_cache=commit_cache,
+            max_batches=DETAIL_WORKERS, comment_concurrency=ASYNC_COMMENT_CONCURRENCY,
+            commit_concurrency=COMMIT_WORKERS,
+        )
+    else:
+        commits = CommitResolver(SESSION, API_VERSION, cache=commit_cache, max_workers=COMMIT_WORKERS)
+        records = iter_export_records(remaining, state, commits)
+
+    records = _handle_raw(records)
+    exported = write_records(output_file, _keep_sample(records), append=bool(checkpoint))
+    if state:
+        state.close()
+    METRICS.incr("workitems_exported_total", exported)
+    if args.engine != "async":
+        print(f"Commits: {commits.fetched} fetched, {commits.cache_hits} from cache {COMMIT_CACHE or '(disabled)'}")
+        METRICS.incr("commits_fetched_total", commits.fetched)
+        METRICS.incr("commit_cache_hits_total", commits.cache_hits)
+    if commit_cache:
+        commit_cache.close()
+    if raw_store:
+        raw_store.close()
+        print(f"Raw work item JSON written to {raw_store.path}")
+    exported += len(completed)
+    if resumable:
+        os.remove(output_file + CHECKPOINT_SUFFIX)
+
+    print(f"\n✅ Exported {exported} work items to {output_file}")
 
-    print(f"\n✅ Saved {len(records)} work items to chromaDB")
-    
     # Show sample
-    if records:
-        sample = records[0]
+    if samples:
+        sample = samples[0]
         print(f"\nSample work item:")
         print(f"  ID: {sample['id']}")
         print(f"  Title: {sample['title']}")
@@ -226,7 +492,12 @@ if __name__ == "__main__":
     print("Export completed successfully!")
     print("=" * 70)
 
-    if not records:
+    if not exported:
         print("NO_NEW_ITEMS=1")
     else:
         print("NO_NEW_ITEMS=0")
+
+
+if __name__ == "__main__":
+    with stage_report("fetch"), profile_stage("fetch"):
+        main()
@@ -1,9 +1,13 @@
 import sqlite3
 import os
 from datetime import datetime, timezone
+from metrics import METRICS, stage_report
+from profiling import profile_stage
+from sync_state import SYNC_STATE_FILE, SyncState
 
 CHROMA_DIR = os.getenv("CHROMA_DIR")
 DB_PATH = os.path.join(CHROMA_DIR, "chroma.sqlite3")
+SYNC_STATE = os.getenv("SYNC_STATE") or os.path.join(CHROMA_DIR, SYNC_STATE_FILE)
 OUTPUT_FILE = os.getenv("DATE_FILE")
 
 def parse_mixed_date(value: str):
@@ -38,27 +42,57 @@ def parse_mixed_date(value: str):
     return None
 
 
-def get_latest_modified_date():
-    if not os.path.exists(DB_PATH):
-        raise FileNotFoundError(f"Chroma database not found at {DB_PATH}")
+def get_latest_epoch(cursor):
+    """
+    MAX over the numeric changedEpoch metadata. The int_value IS NOT NULL
+    predicate lets SQLite answer it from the partial (key, int_value) index
+    instead of scanning the table. Returns a UTC datetime or None.
+    """
+    cursor.execute("""
+        SELECT MAX(int_value) FROM embedding_metadata
+        WHERE key = 'changedEpoch' AND int_value IS NOT NULL
+    """)
+    (value,) = cursor.fetchone()
+    if not value:
+        return None
+    return datetime.fromtimestamp(value, tz=timezone.utc)
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
 
+def scan_latest_date(cursor):
+    """Parse every stored date string. Only needed for indexes written before changedEpoch existed."""
     cursor.execute("""
         SELECT string_value FROM embedding_metadata
         WHERE key IN ('changedDate', 'modifiedDate', 'createdDate')
     """)
-    rows = cursor.fetchall()
-    conn.close()
-
     latest = None
-    for (value,) in rows:
+    for (value,) in cursor.fetchall():
         dt = parse_mixed_date(value)
         if dt and (latest is None or dt > latest):
             latest = dt
+    return latest
+
+
+def get_latest_modified_date():
+    if not os.path.exists(DB_PATH):
+        raise FileNotFoundError(f"Chroma database not found at {DB_PATH}")
+
+    latest = None
+    if os.path.exists(SYNC_STATE):
+        state = SyncState(SYNC_STATE)
+        latest = parse_mixed_date(state.latest_changed_date())
+        state.close()
+
+    if latest is None:
+        conn = sqlite3.connect(DB_PATH)
+        cursor = conn.cursor()
+        latest = get_latest_epoch(cursor)
+        if latest is None:
+            print("No changedEpoch metadata found, scanning date strings")
+            latest = scan_latest_date(cursor)
+        conn.close()
 
     if latest:
+        METRICS.set("watermark_timestamp_seconds", latest.timestamp())
         iso_str = latest.date().isoformat()
         print(f"FILTERED_DATE={iso_str}")
         with open(OUTPUT_FILE, "w") as f:
@@ -66,4 +100,5 @@ def get_latest_modified_date():
 
 
 if __name__ == "__main__":
-    get_latest_modified_date()
+    with stage_report("watermark"), profile_stage("watermark"):
+        get_latest_modified_date()
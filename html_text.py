@@ -0,0 +1,120 @@
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+from bs4.dammit import EntitySubstitution
+
+# Mirrors BeautifulSoup.ASCII_SPACES: strings made only of these collapse
+# to a single space (or newline) in the parse tree
+ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+# Tags seen in Azure DevOps rich-text fields. Anything else (script, style,
+# pre, textarea, ruby annotations, ...) gets special treatment from
+# BeautifulSoup, so the extractor hands those documents over to it.
+SUPPORTED_TAGS = {
+    "a", "abbr", "b", "big", "blockquote", "br", "caption", "center", "cite",
+    "code", "col", "colgroup", "dd", "del", "div", "dl", "dt", "em", "font",
+    "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "ins", "kbd", "label",
+    "li", "mark", "ol", "p", "q", "s", "small", "span", "strike", "strong",
+    "sub", "sup", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "tt",
+    "u", "ul", "wbr",
+}
+# Supported tags BeautifulSoup treats as empty elements
+VOID_TAGS = {"br", "col", "hr", "img", "wbr"}
+
+
+class _Unsupported(Exception):
+    """Raised by the extractor when the markup needs the full BeautifulSoup path."""
+
+
+class _TextExtractor(HTMLParser):
+    """
+    Streaming text extractor that produces the same strings, in the same
+    order, as BeautifulSoup(text, "html.parser") for the supported subset.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self.current = []
+        # Void tags already closed at their start tag; a later explicit
+        # end tag for them is ignored without ending the current string
+        self.already_closed = []
+
+    def end_data(self):
+        if self.current:
+            data = "".join(self.current)
+            self.current = []
+            if not data.strip(ASCII_SPACES):
+                data = "\n" if "\n" in data else " "
+            self.strings.append(data)
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in SUPPORTED_TAGS:
+            raise _Unsupported(tag)
+        self.end_data()
+        if tag in VOID_TAGS:
+            self.already_closed.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag not in SUPPORTED_TAGS:
+            raise _Unsupported(tag)
+        self.end_data()
+
+    def handle_endtag(self, tag):
+        if tag in self.already_closed:
+            self.already_closed.remove(tag)
+            return
+        self.end_data()
+
+    def handle_data(self, data):
+        self.current.append(data)
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.current.append(character if character is not None else f"&{name}")
+
+    def handle_charref(self, name):
+        try:
+            codepoint = int(name[1:], 16) if name[:1] in ("x", "X") else int(name)
+        except ValueError:
+            raise _Unsupported(name)
+        # Control characters, surrogates and the windows-1252 range get
+        # remapped by BeautifulSoup
+        if not (codepoint in (9, 10, 13) or 32 <= codepoint < 127
+                or 160 <= codepoint < 0xD800 or 0xE000 <= codepoint < 0xFFFE):
+            raise _Unsupported(name)
+        self.current.append(chr(codepoint))
+
+    def handle_comment(self, data):
+        # Comments end the current string but are not part of the text
+        self.end_data()
+
+    def handle_decl(self, decl):
+        raise _Unsupported(decl)
+
+    def unknown_decl(self, data):
+        raise _Unsupported(data)
+
+    def handle_pi(self, data):
+        raise _Unsupported(data)
+
+
+def html_to_text(text: str) -> str:
+    """
+    Equivalent of BeautifulSoup(text, "html.parser").get_text(separator=" ").
+    Markup-free strings are returned without parsing, the common ADO HTML
+    subset goes through a streaming html.parser extractor, and anything else
+    (including malformed markup) falls back to BeautifulSoup.
+    """
+    if "<" not in text and "&" not in text:
+        if text and not text.strip(ASCII_SPACES):
+            return "\n" if "\n" in text else " "
+        return text
+
+    extractor = _TextExtractor()
+    try:
+        extractor.feed(text)
+        extractor.close()
+    except (_Unsupported, AssertionError):
+        return BeautifulSoup(text, "html.parser").get_text(separator=" ")
+    extractor.end_data()
+    return " ".join(extractor.strings)
@@ -0,0 +1,179 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+# Directory for run reports: <stage>.json, and <stage>.prom in the Prometheus
+# node_exporter textfile format when METRICS_PROMETHEUS=1. Unset: no files.
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_PROMETHEUS = os.getenv("METRICS_PROMETHEUS") == "1"
+PROMETHEUS_PREFIX = "ado_sync_"
+
+
+def _label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    # Exact, unlike "%g", which would round large values such as timestamps
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _series(name: str, labels: Tuple[Tuple[str, str], ...]) -> str:
+    """Prometheus series name, e.g. http_requests_total{method="GET",status="200"}."""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels) + "}"
+
+
+class Metrics:
+    """
+    Thread-safe counters, gauges and timers for one process. Metrics are
+    identified by name plus optional keyword labels; timers keep a count,
+    total and maximum rather than every observation, so instrumenting a
+    hot path costs a lock and a few additions.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters: Dict[tuple, float] = {}
+        self.gauges: Dict[tuple, float] = {}
+        # (name, labels) -> [count, total seconds, max seconds]
+        self.timers: Dict[tuple, list] = {}
+
+    @staticmethod
+    def _key(name: str, labels: dict) -> tuple:
+        return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def incr(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self.lock:
+            self.gauges[self._key(name, labels)] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = self._key(name, labels)
+        with self.lock:
+            timer = self.timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        """JSON-ready copy of every metric, keyed by Prometheus series name."""
+        with self.lock:
+            return {
+                "counters": {_series(*key): value for key, value in sorted(self.counters.items())},
+                "gauges": {_series(*key): value for key, value in sorted(self.gauges.items())},
+                "timers": {
+                    _series(*key): {
+                        "count": count,
+                        "total_seconds": round(total, 6),
+                        "mean_seconds": round(total / count, 6) if count else 0.0,
+                        "max_seconds": round(longest, 6),
+                    }
+                    for key, (count, total, longest) in sorted(self.timers.items())
+                },
+            }
+
+    def to_prometheus(self, stage: str) -> str:
+        """Every metric in the text exposition format, labelled with the stage."""
+        lines = []
+
+        def _family(name: str, kind: str, samples: list) -> None:
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}{name} {kind}")
+            for suffix, labels, value in samples:
+                labels = tuple(sorted(labels + (("stage", stage),)))
+                lines.append(f"{_series(PROMETHEUS_PREFIX + name + suffix, labels)} {_number(value)}")
+
+        with self.lock:
+            by_name: Dict[Tuple[str, str], list] = {}
+            for (name, labels), value in self.counters.items():
+                by_name.setdefault((name, "counter"), []).append(("", labels, value))
+            for (name, labels), value in self.gauges.items():
+                by_name.setdefault((name, "gauge"), []).append(("", labels, value))
+            for (name, labels), (count, total, longest) in self.timers.items():
+                by_name.setdefault((name, "summary"), []).extend([("_count", labels, count), ("_sum", labels, total)])
+                by_name.setdefault((name + "_max", "gauge"), []).append(("", labels, longest))
+        for (name, kind), samples in sorted(by_name.items()):
+            _family(name, kind, sorted(samples))
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.timers.clear()
+
+
+# Shared by every module of the running stage
+METRICS = Metrics()
+
+
+def _write_atomic(path: str, text: str) -> None:
+    # The textfile collector may read at any moment; never expose a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def write_run_report(stage: str, started: datetime, duration: float, succeeded: bool,
+                     metrics: Metrics = METRICS, metrics_dir: Optional[str] = METRICS_DIR,
+                     prometheus: bool = METRICS_PROMETHEUS) -> Optional[str]:
+    """Write <metrics_dir>/<stage>.json (and .prom); returns the JSON path, or None when disabled."""
+    if not metrics_dir:
+        return None
+    os.makedirs(metrics_dir, exist_ok=True)
+    metrics.set("stage_duration_seconds", duration)
+    metrics.set("stage_success", 1 if succeeded else 0)
+    metrics.set("stage_last_run_timestamp_seconds", started.timestamp())
+
+    report = {
+        "stage": stage,
+        "status": "succeeded" if succeeded else "failed",
+        "started": started.isoformat(timespec="seconds"),
+        "duration_seconds": round(duration, 3),
+        **metrics.snapshot(),
+    }
+    path = os.path.join(metrics_dir, f"{stage}.json")
+    _write_atomic(path, json.dumps(report, indent=2) + "\n")
+    if prometheus:
+        _write_atomic(os.path.join(metrics_dir, f"{stage}.prom"), metrics.to_prometheus(stage))
+    return path
+
+
+@contextmanager
+def stage_report(stage: str, metrics: Metrics = METRICS):
+    """
+    Time the wrapped stage and write its run report when it ends, including
+    when it fails or exits early (exit code 0 counts as success).
+    """
+    started = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    succeeded = False
+    try:
+        yield metrics
+        succeeded = True
+    except SystemExit as e:
+        succeeded = not e.code
+        raise
+    finally:
+        path = write_run_report(stage, started, time.perf_counter() - start, succeeded, metrics)
+        if path:
+            print(f"Run report written to {path}")
@@ -0,0 +1,173 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import List, Optional
+
+# cpu: cProfile; memory: tracemalloc; all: both. Unset or "none": off.
+PROFILE_MODE = (os.getenv("PROFILE_MODE") or "none").lower()
+# Where <stage>.prof, <stage>.prof.txt and <stage>.alloc.txt are written
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Frames kept per allocation; more gives longer tracebacks at a higher cost
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "10"))
+PROFILE_TOP = int(os.getenv("PROFILE_TOP", "40"))
+# How often the memory sampler checks whether a new peak snapshot is due
+PEAK_POLL_SECONDS = 0.5
+
+
+class _ThreadProfilers:
+    """
+    cProfile only sees the thread that enabled it. This starts a profiler
+    in every thread created while profiling is on (detail, comment and
+    commit pools, the async engine's loop) so their time is merged into
+    the stage profile. On Python 3.12+ a single profiler already covers
+    all threads and enabling another fails, which is ignored.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profilers: List[cProfile.Profile] = []
+
+    def _start(self, frame, event, arg):
+        sys.setprofile(None)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return
+        with self.lock:
+            self.profilers.append(profiler)
+
+    def install(self) -> None:
+        threading.setprofile(self._start)
+
+    def uninstall(self) -> List[cProfile.Profile]:
+        threading.setprofile(None)
+        with self.lock:
+            profilers, self.profilers = self.profilers, []
+        for profiler in profilers:
+            profiler.disable()
+        return profilers
+
+
+class _PeakSampler(threading.Thread):
+    """
+    Keeps the tracemalloc snapshot taken closest to peak traced memory.
+    Streaming stages free most of their memory by the end, so a final
+    snapshot alone would not show what the peak was made of.
+    """
+
+    def __init__(self):
+        super().__init__(name="tracemalloc-peak", daemon=True)
+        self.stopped = threading.Event()
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        self.snapshot_size = 0
+
+    def run(self) -> None:
+        while not self.stopped.wait(PEAK_POLL_SECONDS):
+            current, _ = tracemalloc.get_traced_memory()
+            # Snapshots are expensive; only retake one when memory grew by a tenth
+            if current > self.snapshot_size * 1.1:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_size = current
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.join()
+
+
+def _filtered(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+
+
+def _format_top(snapshot: tracemalloc.Snapshot, top: int) -> List[str]:
+    lines = []
+    stats = _filtered(snapshot).statistics("lineno")
+    lines.append(f"{'size':>12} {'blocks':>9}  location")
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 1024:10.1f}KB {stat.count:9d}  {frame.filename}:{frame.lineno}")
+    lines.append("")
+    lines.append("Largest allocation tracebacks:")
+    for stat in _filtered(snapshot).statistics("traceback")[:min(top, 10)]:
+        lines.append(f"\n{stat.size / 1024:.1f}KB in {stat.count} blocks")
+        lines.extend(f"  {line}" for line in stat.traceback.format())
+    return lines
+
+
+def write_allocation_report(path: str, stage: str, peak: int, peak_snapshot: Optional[tracemalloc.Snapshot],
+                            final_snapshot: tracemalloc.Snapshot, top: int = PROFILE_TOP) -> None:
+    lines = [f"tracemalloc report for stage {stage}", f"Peak traced memory: {peak / 1e6:.1f} MB", ""]
+    if peak_snapshot is not None:
+        lines.append("Top allocations near the peak:")
+        lines.extend(_format_top(peak_snapshot, top))
+        lines.append("")
+    lines.append("Top allocations still live at the end of the stage:")
+    lines.extend(_format_top(final_snapshot, top))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def write_cpu_report(prof_path: str, profilers: List[cProfile.Profile], top: int = PROFILE_TOP) -> None:
+    """Merge the profilers into one .prof file (pstats / snakeviz) plus a readable top list."""
+    stats = pstats.Stats(profilers[0])
+    for profiler in profilers[1:]:
+        stats.add(profiler)
+    stats.dump_stats(prof_path)
+
+    text = io.StringIO()
+    summary = pstats.Stats(prof_path, stream=text)
+    text.write(f"Merged from {len(profilers)} thread profiler(s)\n")
+    summary.sort_stats("cumulative").print_stats(top)
+    summary.sort_stats("tottime").print_stats(top)
+    with open(prof_path + ".txt", "w", encoding="utf-8") as f:
+        f.write(text.getvalue())
+
+
+@contextmanager
+def profile_stage(stage: str, mode: str = PROFILE_MODE, profile_dir: str = PROFILE_DIR):
+    """
+    Profile the wrapped stage according to mode (cpu, memory, all or
+    none) and write the reports to profile_dir, also when the stage fails.
+    Worker processes (clean_workitems.py --workers) are not profiled.
+    """
+    cpu = mode in ("cpu", "all", "1")
+    memory = mode in ("memory", "all", "1")
+    if not cpu and not memory:
+        yield
+        return
+
+    os.makedirs(profile_dir, exist_ok=True)
+    base = os.path.join(profile_dir, stage)
+    threads, main_profiler, sampler = None, None, None
+    if memory:
+        tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        sampler = _PeakSampler()
+        sampler.start()
+    if cpu:
+        threads = _ThreadProfilers()
+        threads.install()
+        main_profiler = cProfile.Profile()
+        main_profiler.enable()
+    try:
+        yield
+    finally:
+        if cpu:
+            main_profiler.disable()
+            write_cpu_report(f"{base}.prof", [main_profiler] + threads.uninstall())
+            print(f"CPU profile written to {base}.prof")
+        if memory:
+            sampler.stop()
+            _, peak = tracemalloc.get_traced_memory()
+            final_snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            write_allocation_report(f"{base}.alloc.txt", stage, peak, sampler.snapshot, final_snapshot)
+            print(f"Allocation report written to {base}.alloc.txt")
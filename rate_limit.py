@@ -0,0 +1,227 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Iterable, Optional
+
+import requests
+
+from metrics import METRICS
+
+# Throttled or transiently unavailable; worth another attempt
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # "Full jitter": spreads out workers that were throttled together
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def observe_response(bucket: "TokenBucket", status_code: int, headers, ok: bool) -> Optional[float]:
+    """
+    Adapt the bucket to the rate-limit headers of a response.
+    Returns the server-requested delay in seconds, if any.
+    """
+    retry_after = parse_retry_after(headers.get("Retry-After"))
+    if retry_after is not None:
+        bucket.pause(retry_after)
+
+    # Azure DevOps reports the remaining budget before it starts rejecting
+    remaining, limit = headers.get("X-RateLimit-Remaining"), headers.get("X-RateLimit-Limit")
+    near_limit = False
+    if remaining is not None and limit:
+        try:
+            near_limit = float(remaining) < 0.1 * float(limit)
+        except ValueError:
+            pass
+        if near_limit:
+            bucket.slow_down()
+            reset = headers.get("X-RateLimit-Reset")
+            if retry_after is None and reset:
+                try:
+                    retry_after = max(0.0, float(reset) - time.time())
+                except ValueError:
+                    pass
+
+    if status_code in (429, 503):
+        bucket.slow_down()
+    elif ok and not near_limit and retry_after is None:
+        bucket.speed_up()
+    return retry_after
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket shared by every worker of a session.
+    The refill rate adapts to the server: it is halved on throttling
+    responses and grows by a fixed step after successful ones (AIMD), up to
+    max_rate (ten times the starting rate by default) so it can find a
+    higher limit than configured. The whole bucket can be paused until a
+    server-given retry time.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, min_rate: float = 0.5,
+                 max_rate: Optional[float] = None):
+        self.max_rate = max(rate, max_rate or rate * 10)
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.step = max(rate / 50, 0.01)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now <= self.updated:
+            # Still inside a pause
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self) -> float:
+        """Take a token if one is available and return 0, otherwise return the seconds to wait before trying again."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            delay = self.paused_until - now
+            if delay > 0:
+                return delay
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        """Block until a request may be sent."""
+        while True:
+            delay = self.reserve()
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for seconds, e.g. for a Retry-After header."""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.paused_until = max(self.paused_until, now + seconds)
+            # No burst of saved-up tokens when the pause ends
+            self.tokens = 0.0
+            self.updated = max(self.updated, self.paused_until)
+
+    def slow_down(self) -> None:
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.step)
+
+
+class RetryPolicy:
+    """
+    Pacing and retry decisions shared by ThrottledSession and the async
+    engine's client: a TokenBucket adapted to the rate-limit headers, and
+    retries of throttled or failed requests with jittered exponential
+    backoff. Only methods in retry_methods are retried, at most max_retries
+    times. The clients own the send / sleep loop; this decides what it does.
+    """
+
+    def __init__(self, bucket: TokenBucket, max_retries: int = 5, backoff_base: float = 0.5,
+                 backoff_max: float = 60.0, retry_methods: Iterable[str] = IDEMPOTENT_METHODS):
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_methods = frozenset(m.upper() for m in retry_methods)
+        self.retries = 0
+        self._count_lock = threading.Lock()
+
+    def _backoff(self, attempt: int) -> float:
+        return backoff_delay(attempt, self.backoff_base, self.backoff_max)
+
+    def _retryable(self, method: str, attempt: int) -> bool:
+        return method in self.retry_methods and attempt < self.max_retries
+
+    def delay_after_response(self, method: str, attempt: int, start: float, status_code: int, headers, ok: bool,
+                             size: Optional[int] = None) -> Optional[float]:
+        """Record a response; return the seconds to wait before retrying it, or None to return it."""
+        METRICS.observe("http_request_seconds", time.perf_counter() - start, method=method)
+        METRICS.incr("http_requests_total", method=method, status=status_code)
+        if size is not None:
+            METRICS.incr("http_response_bytes_total", size)
+        retry_after = observe_response(self.bucket, status_code, headers, ok)
+        if status_code not in RETRY_STATUSES or not self._retryable(method, attempt):
+            return None
+        return retry_after if retry_after is not None else self._backoff(attempt)
+
+    def delay_after_error(self, method: str, attempt: int, start: float, error: Exception) -> Optional[float]:
+        """Record a connection error; return the seconds to wait before retrying, or None to raise it."""
+        METRICS.observe("http_request_seconds", time.perf_counter() - start, method=method)
+        METRICS.incr("http_requests_total", method=method, status=type(error).__name__)
+        return self._backoff(attempt) if self._retryable(method, attempt) else None
+
+    def count_retry(self, method: str, url: str, attempt: int, delay: float, reason: str) -> None:
+        with self._count_lock:
+            self.retries += 1
+        METRICS.incr("http_retries_total", reason=reason)
+        print(f"  Retry {attempt}/{self.max_retries} of {method} {url.split('?')[0]} after {reason}, waiting {delay:.1f}s")
+
+
+class ThrottledSession(requests.Session, RetryPolicy):
+    """
+    requests.Session that paces requests through a TokenBucket, honours
+    Retry-After and X-RateLimit-* headers, and retries throttled or failed
+    requests as RetryPolicy decides; the last response is returned (or the
+    last connection error raised) once max_retries is used up.
+    """
+
+    def __init__(self, bucket: TokenBucket, max_retries: int = 5, backoff_base: float = 0.5,
+                 backoff_max: float = 60.0, retry_methods: Iterable[str] = IDEMPOTENT_METHODS):
+        requests.Session.__init__(self)
+        RetryPolicy.__init__(self, bucket, max_retries, backoff_base, backoff_max, retry_methods)
+
+    def request(self, method, url, *args, **kwargs):
+        method = method.upper()
+        attempt = 0
+        while True:
+            with METRICS.timer("rate_limit_wait_seconds"):
+                self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self.delay_after_error(method, attempt, start, e)
+                if delay is None:
+                    raise
+                reason = type(e).__name__
+            else:
+                size = None if kwargs.get("stream") else len(response.content)
+                delay = self.delay_after_response(method, attempt, start, response.status_code,
+                                                  response.headers, response.ok, size)
+                if delay is None:
+                    return response
+                reason = str(response.status_code)
+                response.close()
+
+            attempt += 1
+            self.count_retry(method, url, attempt, delay, reason)
+            time.sleep(delay)
@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from records_io import split_ext
+from typing import Dict, Iterable, Iterator, Optional
+
+RAW_SUFFIX = ".raw.ndjson.gz"
+
+
+def raw_store_path(output_file: str) -> str:
+    """Side file for the raw work item JSON of an export, e.g. export.ndjson -> export.raw.ndjson.gz."""
+    base, _ = split_ext(output_file)
+    return base + RAW_SUFFIX
+
+
+def raw_ref(raw: dict) -> str:
+    """Content address of a raw blob: sha256 of its canonical JSON."""
+    canonical = json.dumps(raw, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _iter_entries(path: str) -> Iterator[dict]:
+    """
+    Yield the complete {"ref", "raw"} entries of a side file, member by
+    member. An export killed mid-write leaves a torn last member; every
+    line flushed before the kill is still yielded, then the scan stops.
+    """
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    pending = b""
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(1 << 16)
+            if not data:
+                return
+            while data:
+                try:
+                    pending += decompressor.decompress(data)
+                except zlib.error:
+                    return
+                if decompressor.eof:
+                    # Start of the next member, written by a resumed export
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                else:
+                    data = b""
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+
+
+class RawStore:
+    """
+    Append-only gzip NDJSON file of {"ref", "raw"} lines. Export records
+    keep only the ref, so the main artifact stays small; identical blobs
+    are written once. Every put is flushed before its ref is returned, so a
+    record that reached the export always has a readable blob.
+
+    Resuming (keep given) rewrites the file with only the entries whose
+    refs are in keep, dropping the torn member of the interrupted run;
+    seen then tells which of them were recovered.
+    """
+
+    def __init__(self, path: str, keep: Optional[Iterable[str]] = None):
+        self.path = path
+        self.seen = set()
+        if keep is not None and os.path.exists(path):
+            keep = set(keep)
+            tmp = path + ".tmp"
+            with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=1) as f:
+                for entry in _iter_entries(path):
+                    if entry["ref"] in keep and entry["ref"] not in self.seen:
+                        self.seen.add(entry["ref"])
+                        f.write(json.dumps(entry, ensure_ascii=False))
+                        f.write("\n")
+            os.replace(tmp, path)
+        self.file = gzip.open(path, "at" if keep is not None else "wt", encoding="utf-8", compresslevel=1)
+
+    def put(self, raw: dict) -> str:
+        ref = raw_ref(raw)
+        if ref not in self.seen:
+            self.seen.add(ref)
+            self.file.write(json.dumps({"ref": ref, "raw": raw}, ensure_ascii=False))
+            self.file.write("\n")
+            # Sync-flushes the compressor: the blob is readable even if the member is never finished
+            self.file.flush()
+        return ref
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def load_raw(path: str, refs: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """
+    Return {ref: raw work item JSON} from a side file, only for refs when
+    given. Entries of every member are read, up to a torn one left by an
+    interrupted export.
+    """
+    wanted = set(refs) if refs is not None else None
+    found = {}
+    for entry in _iter_entries(path):
+        if wanted is None or entry["ref"] in wanted:
+            found[entry["ref"]] = entry["raw"]
+            if wanted is not None and len(found) == len(wanted):
+                break
+    return found
@@ -0,0 +1,126 @@
+import gzip
+import io
+import json
+import os
+from typing import Iterable, Iterator, Tuple
+
+# Stage artifact formats, chosen by file extension:
+#   .ndjson / .jsonl               newline-delimited JSON
+#   .ndjson.gz / .jsonl.gz         gzip-compressed NDJSON
+#   .ndjson.zst / .jsonl.zst       zstd-compressed NDJSON (needs `zstandard`)
+#   .msgpack / .mpk                a stream of msgpack maps (needs `msgpack`)
+#   .json                          legacy pretty-printed JSON array
+# All but .json are streamed, appendable and work with named pipes.
+NDJSON_EXTENSIONS = (".ndjson", ".jsonl")
+GZIP_EXTENSIONS = tuple(ext + ".gz" for ext in NDJSON_EXTENSIONS)
+ZSTD_EXTENSIONS = tuple(ext + ".zst" for ext in NDJSON_EXTENSIONS)
+MSGPACK_EXTENSIONS = (".msgpack", ".mpk")
+STREAM_EXTENSIONS = NDJSON_EXTENSIONS + GZIP_EXTENSIONS + ZSTD_EXTENSIONS + MSGPACK_EXTENSIONS
+
+
+def is_ndjson(path: str) -> bool:
+    """Plain, uncompressed NDJSON: one record per text line."""
+    return path.endswith(NDJSON_EXTENSIONS)
+
+
+def is_streamed(path: str) -> bool:
+    """Any format that is written and read one record at a time."""
+    return path.endswith(STREAM_EXTENSIONS)
+
+
+def split_ext(path: str) -> Tuple[str, str]:
+    """Like os.path.splitext, but keeps compound extensions such as .ndjson.gz together."""
+    for ext in sorted(STREAM_EXTENSIONS, key=len, reverse=True):
+        if path.endswith(ext):
+            return path[:-len(ext)], ext
+    return os.path.splitext(path)
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("Reading or writing .zst artifacts requires: pip install zstandard")
+    return zstandard
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        raise RuntimeError("Reading or writing .msgpack artifacts requires: pip install msgpack")
+    return msgpack
+
+
+def _open_text(path: str, mode: str):
+    """Open an NDJSON variant for text reading ("r") or writing ("w" / "a")."""
+    if path.endswith(GZIP_EXTENSIONS):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    if path.endswith(ZSTD_EXTENSIONS):
+        zstandard = _zstd()
+        raw = open(path, mode + "b")
+        if mode == "r":
+            # Appended runs are separate frames
+            stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        else:
+            stream = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(stream, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def iter_records(path: str) -> Iterator[dict]:
+    """
+    Yield records one at a time from a stage artifact.
+    Streamed formats are decoded record by record; legacy pretty-printed
+    JSON arrays (.json) are loaded whole.
+    """
+    if path.endswith(MSGPACK_EXTENSIONS):
+        with open(path, "rb") as f:
+            yield from _msgpack().Unpacker(f, raw=False)
+        return
+
+    if not is_streamed(path):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+        return
+
+    with _open_text(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def write_records(path: str, records: Iterable[dict], append: bool = False) -> int:
+    """
+    Write records to a stage artifact, consuming the iterable lazily for
+    streamed formats. Works with named pipes, so the next stage can start
+    reading before this one finishes. append adds to an existing streamed
+    artifact instead of replacing it.
+    Returns the number of records written.
+    """
+    if append and not is_streamed(path):
+        raise ValueError(f"Can only append to a streamed format, not {path}")
+    mode = "a" if append else "w"
+    count = 0
+
+    if path.endswith(MSGPACK_EXTENSIONS):
+        packer = _msgpack().Packer()
+        with open(path, mode + "b") as f:
+            for rec in records:
+                f.write(packer.pack(rec))
+                count += 1
+        return count
+
+    if not is_streamed(path):
+        records = list(records)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(records, f, indent=2, ensure_ascii=False)
+        return len(records)
+
+    with _open_text(path, mode) as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            count += 1
+    return count
@@ -0,0 +1,278 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import boto3
+
+from metrics import METRICS, stage_report
+from profiling import profile_stage
+
+S3_BUCKET = os.getenv("S3_BUCKET")
+CHROMA_DIR = os.getenv("CHROMA_DIR")
+# Defaults to the Chroma directory name, matching the old `aws s3 sync` target
+S3_PREFIX = os.getenv("S3_PREFIX") or (CHROMA_DIR or "").strip("/")
+# Set for MinIO or other S3-compatible endpoints
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
+# SQLite and HNSW files are rewritten in place, so fixed-size blocks line up
+# between runs and unchanged regions hash to the same block
+BLOCK_SIZE = int(os.getenv("S3_BLOCK_SIZE", str(4 * 1024 * 1024)))
+TRANSFER_WORKERS = int(os.getenv("S3_TRANSFER_WORKERS", "16"))
+KEEP_VERSIONS = int(os.getenv("S3_KEEP_VERSIONS", "3"))
+
+
+def make_client():
+    return boto3.client("s3", endpoint_url=S3_ENDPOINT_URL)
+
+
+def _blocks_key(prefix: str, digest: str) -> str:
+    return f"{prefix}/blocks/{digest}"
+
+
+def _manifest_key(prefix: str, version: str) -> str:
+    return f"{prefix}/manifests/{version}.json"
+
+
+def _latest_key(prefix: str) -> str:
+    return f"{prefix}/latest"
+
+
+def _version_seq(version: str) -> int:
+    """Publish sequence number of a version; 0 for versions named before it was added."""
+    head = version.split("-", 1)[0]
+    return int(head) if head.isdigit() else 0
+
+
+def _manifest_order(key: str) -> tuple:
+    # Versions published in the same second must still sort in publish order
+    version = key.rsplit("/", 1)[-1][:-len(".json")]
+    return _version_seq(version), version
+
+
+def _iter_file_blocks(path: Path, block_size: int):
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            yield data
+
+
+def build_manifest(local_dir: str, block_size: int = BLOCK_SIZE) -> dict:
+    """
+    Describe every file under local_dir as a list of content-addressed
+    blocks (sha256 of each fixed-size block).
+    """
+    root = Path(local_dir)
+    files = {}
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        digests = [hashlib.sha256(data).hexdigest() for data in _iter_file_blocks(path, block_size)]
+        files[path.relative_to(root).as_posix()] = {"size": path.stat().st_size, "blocks": digests}
+    return {"block_size": block_size, "files": files}
+
+
+def _list_keys(s3, bucket: str, prefix: str) -> List[str]:
+    keys = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+def read_latest_version(s3, bucket: str, prefix: str) -> Optional[str]:
+    """Return the version the latest pointer refers to, or None if nothing was published yet."""
+    try:
+        pointer = s3.get_object(Bucket=bucket, Key=_latest_key(prefix))
+    except s3.exceptions.NoSuchKey:
+        return None
+    return json.loads(pointer["Body"].read())["version"]
+
+
+def read_latest_manifest(s3, bucket: str, prefix: str) -> Optional[dict]:
+    """Return the manifest the latest pointer refers to, or None if nothing was published yet."""
+    version = read_latest_version(s3, bucket, prefix)
+    if version is None:
+        return None
+    body = s3.get_object(Bucket=bucket, Key=_manifest_key(prefix, version))["Body"].read()
+    return json.loads(body)
+
+
+def publish(local_dir: str, bucket: str, prefix: str, s3=None, block_size: int = BLOCK_SIZE) -> dict:
+    """
+    Upload the blocks of local_dir that the bucket doesn't have yet, write a
+    versioned manifest, then flip the latest pointer to it. Readers see either
+    the previous or the new version, never a mix. Returns the manifest.
+    """
+    s3 = s3 or make_client()
+    manifest = build_manifest(local_dir, block_size)
+    existing = {key.rsplit("/", 1)[-1] for key in _list_keys(s3, bucket, f"{prefix}/blocks/")}
+
+    # Map each new digest to one place it can be read from
+    sources: Dict[str, tuple] = {}
+    for rel_path, entry in manifest["files"].items():
+        for index, digest in enumerate(entry["blocks"]):
+            if digest not in existing and digest not in sources:
+                sources[digest] = (rel_path, index)
+
+    def _upload(item):
+        digest, (rel_path, index) = item
+        with open(Path(local_dir) / rel_path, "rb") as f:
+            f.seek(index * block_size)
+            data = f.read(block_size)
+        s3.put_object(Bucket=bucket, Key=_blocks_key(prefix, digest), Body=data)
+        return len(data)
+
+    with ThreadPoolExecutor(max_workers=TRANSFER_WORKERS) as pool:
+        uploaded_bytes = sum(pool.map(_upload, sources.items()))
+
+    content_digest = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+    # A zero-padded sequence number orders versions; the timestamp is for humans
+    seq = 1 + max((_manifest_order(key)[0] for key in _list_keys(s3, bucket, f"{prefix}/manifests/")), default=0)
+    version = f"{seq:010d}-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{content_digest[:12]}"
+    manifest["version"] = version
+    body = json.dumps(manifest, sort_keys=True).encode("utf-8")
+    s3.put_object(Bucket=bucket, Key=_manifest_key(prefix, version), Body=body)
+    # Single-object PUT is atomic: this is the commit point
+    s3.put_object(Bucket=bucket, Key=_latest_key(prefix), Body=json.dumps({"version": version}).encode("utf-8"))
+
+    total_blocks = sum(len(entry["blocks"]) for entry in manifest["files"].values())
+    print(f"Published {version}: {len(sources)}/{total_blocks} blocks uploaded ({uploaded_bytes / 1e6:.1f} MB)")
+    METRICS.incr("s3_blocks_uploaded_total", len(sources))
+    METRICS.incr("s3_blocks_reused_total", total_blocks - len(sources))
+    METRICS.incr("s3_bytes_uploaded_total", uploaded_bytes)
+    return manifest
+
+
+def prune(bucket: str, prefix: str, s3=None, keep: int = KEEP_VERSIONS) -> int:
+    """
+    Delete manifests older than the newest keep versions, and blocks no
+    longer referenced by any remaining manifest. The manifest the latest
+    pointer refers to is always kept. Returns the number of blocks deleted.
+    """
+    s3 = s3 or make_client()
+    # Read the pointer first: a manifest published after this is newer than it and kept too
+    latest = read_latest_version(s3, bucket, prefix)
+    manifest_keys = sorted(_list_keys(s3, bucket, f"{prefix}/manifests/"), key=_manifest_order)
+    stale_manifests = manifest_keys[:-keep] if keep > 0 else []
+    if latest is not None:
+        stale_manifests = [key for key in stale_manifests if key != _manifest_key(prefix, latest)]
+    kept_manifests = [key for key in manifest_keys if key not in stale_manifests]
+    referenced = set()
+    for key in kept_manifests:
+        manifest = json.loads(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+        for entry in manifest["files"].values():
+            referenced.update(entry["blocks"])
+
+    stale_blocks = [key for key in _list_keys(s3, bucket, f"{prefix}/blocks/") if key.rsplit("/", 1)[-1] not in referenced]
+    stale = stale_manifests + stale_blocks
+    # delete_objects accepts at most 1000 keys per call
+    for i in range(0, len(stale), 1000):
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": [{"Key": key} for key in stale[i:i+1000]]})
+    print(f"Pruned {len(stale_manifests)} manifests and {len(stale_blocks)} blocks")
+    METRICS.incr("s3_blocks_pruned_total", len(stale_blocks))
+    return len(stale_blocks)
+
+
+def download(local_dir: str, bucket: str, prefix: str, s3=None) -> dict:
+    """
+    Bring local_dir in line with the latest published manifest, fetching only
+    blocks that are not already present in any local file. Each file is
+    rebuilt in a temp file and renamed into place; files not in the manifest
+    are removed. Returns the manifest.
+    """
+    s3 = s3 or make_client()
+    manifest = read_latest_manifest(s3, bucket, prefix)
+    if manifest is None:
+        raise FileNotFoundError(f"No published manifest at s3://{bucket}/{_latest_key(prefix)}")
+    block_size = manifest["block_size"]
+    root = Path(local_dir)
+    root.mkdir(parents=True, exist_ok=True)
+
+    # Index the blocks we already have locally by digest
+    local = build_manifest(local_dir, block_size)
+    have: Dict[str, tuple] = {}
+    for rel_path, entry in local["files"].items():
+        for index, digest in enumerate(entry["blocks"]):
+            have.setdefault(digest, (rel_path, index))
+
+    needed = {digest for entry in manifest["files"].values() for digest in entry["blocks"] if digest not in have}
+
+    # Missing blocks are staged on disk next to local_dir, not held in memory
+    staging = Path(tempfile.mkdtemp(prefix=f".{root.name}-blocks-", dir=root.parent))
+
+    def _fetch(digest: str) -> int:
+        data = s3.get_object(Bucket=bucket, Key=_blocks_key(prefix, digest))["Body"].read()
+        (staging / digest).write_bytes(data)
+        return len(data)
+
+    def _read_block(digest: str) -> bytes:
+        if digest in needed:
+            return (staging / digest).read_bytes()
+        rel_path, index = have[digest]
+        with open(root / rel_path, "rb") as f:
+            f.seek(index * block_size)
+            return f.read(block_size)
+
+    try:
+        with ThreadPoolExecutor(max_workers=TRANSFER_WORKERS) as pool:
+            fetched_bytes = sum(pool.map(_fetch, needed))
+
+        # Assemble every file before renaming any, so local blocks are read
+        # from the old versions
+        staged = []
+        for rel_path, entry in manifest["files"].items():
+            target = root / rel_path
+            if local["files"].get(rel_path) == {"size": entry["size"], "blocks": entry["blocks"]}:
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            tmp = staging / f"file-{len(staged)}"
+            with open(tmp, "wb") as f:
+                for digest in entry["blocks"]:
+                    f.write(_read_block(digest))
+            staged.append((tmp, target))
+        for tmp, target in staged:
+            os.replace(tmp, target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    for rel_path in local["files"]:
+        if rel_path not in manifest["files"]:
+            (root / rel_path).unlink()
+
+    print(f"Downloaded {manifest['version']}: {len(needed)} blocks fetched ({fetched_bytes / 1e6:.1f} MB), "
+          f"{len(staged)} files updated")
+    METRICS.incr("s3_blocks_downloaded_total", len(needed))
+    METRICS.incr("s3_bytes_downloaded_total", fetched_bytes)
+    METRICS.incr("s3_files_updated_total", len(staged))
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish or download the Chroma directory as content-addressed blocks in S3")
+    parser.add_argument("command", choices=["publish", "download", "prune"])
+    parser.add_argument("--dir", default=CHROMA_DIR, help="Local Chroma directory (env: CHROMA_DIR)")
+    parser.add_argument("--bucket", default=S3_BUCKET, help="S3 bucket (env: S3_BUCKET)")
+    parser.add_argument("--prefix", default=S3_PREFIX, help="Key prefix (env: S3_PREFIX, default: CHROMA_DIR)")
+    parser.add_argument("--if-exists", action="store_true",
+                        help="download: exit quietly when nothing has been published yet")
+    args = parser.parse_args()
+
+    with stage_report(f"s3_{args.command}"), profile_stage(f"s3_{args.command}"):
+        if args.command == "publish":
+            publish(args.dir, args.bucket, args.prefix)
+            prune(args.bucket, args.prefix)
+        elif args.command == "download":
+            try:
+                download(args.dir, args.bucket, args.prefix)
+            except FileNotFoundError as e:
+                if not args.if_exists:
+                    raise
+                print(f"Nothing to download: {e}")
+        else:
+            prune(args.bucket, args.prefix)
@@ -0,0 +1,24 @@
+import sqlite3
+from typing import Iterable, Iterator, Tuple
+
+# SQLite's default limit on bound variables per statement is 999
+MAX_SQL_VARS = 900
+
+
+def in_batches(values: Iterable) -> Iterator[Tuple[str, list]]:
+    """
+    Split values (duplicates removed) into batches small enough for one
+    statement; yields (placeholders, batch) for "... IN ({placeholders})".
+    """
+    unique = list(dict.fromkeys(values))
+    for i in range(0, len(unique), MAX_SQL_VARS):
+        batch = unique[i:i+MAX_SQL_VARS]
+        yield ",".join("?" * len(batch)), batch
+
+
+def connect_shared(path: str) -> sqlite3.Connection:
+    """
+    Connection that may also be used from threads other than the one that
+    opened it, such as the async fetch engine's event loop thread.
+    """
+    return sqlite3.connect(path, check_same_thread=False)
@@ -0,0 +1,92 @@
+import json
+from typing import Dict, Iterable, List, Optional
+
+from sqlite_utils import connect_shared, in_batches
+
+SYNC_STATE_FILE = "sync_state.sqlite3"
+
+
+class SyncState:
+    """
+    Ledger of what has been written to the index, stored in a SQLite file
+    next to the Chroma database. For each work item it records System.Rev
+    and System.ChangedDate, and for each chunk written its id and metadata
+    (which includes the contentHash). fetch_workitems skips items whose rev
+    is unchanged; upload_workitems diffs against it instead of querying
+    Chroma, and updates it after every batch so an interrupted run leaves
+    it consistent with what was written.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = connect_shared(path)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                rev INTEGER,
+                changed_date TEXT
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                item_id INTEGER NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_item_id ON chunks (item_id);
+        """)
+        self.conn.commit()
+
+    def get_revs(self, item_ids: Iterable[int]) -> Dict[int, Optional[int]]:
+        """Return {item id: rev} for the given ids that are in the ledger."""
+        revs = {}
+        for placeholders, batch in in_batches(item_ids):
+            rows = self.conn.execute(f"SELECT id, rev FROM items WHERE id IN ({placeholders})", batch)
+            revs.update(rows)
+        return revs
+
+    def get_chunks(self, item_ids: Iterable[int]) -> Dict[str, dict]:
+        """Return {chunk id: metadata} for the chunks last written for item_ids."""
+        chunks = {}
+        for placeholders, batch in in_batches(item_ids):
+            rows = self.conn.execute(
+                f"SELECT chunk_id, metadata FROM chunks WHERE item_id IN ({placeholders})", batch
+            )
+            chunks.update((chunk_id, json.loads(metadata)) for chunk_id, metadata in rows)
+        return chunks
+
+    def record_items(self, items: Dict[int, dict], chunks: Dict[int, Dict[str, dict]]) -> None:
+        """
+        Replace the ledger entries of the given items in one transaction.
+        items maps id -> {"rev", "changedDate"}; chunks maps id -> {chunk id: metadata}.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO items (id, rev, changed_date) VALUES (?, ?, ?)",
+                [(item_id, item.get("rev"), item.get("changedDate")) for item_id, item in items.items()]
+            )
+            for placeholders, batch in in_batches(items):
+                self.conn.execute(f"DELETE FROM chunks WHERE item_id IN ({placeholders})", batch)
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunks (chunk_id, item_id, metadata) VALUES (?, ?, ?)",
+                [
+                    (chunk_id, item_id, json.dumps(metadata, sort_keys=True))
+                    for item_id, item_chunks in chunks.items()
+                    for chunk_id, metadata in item_chunks.items()
+                ]
+            )
+
+    def item_ids(self) -> List[int]:
+        return [item_id for (item_id,) in self.conn.execute("SELECT id FROM items")]
+
+    def remove_items(self, item_ids: Iterable[int]) -> None:
+        with self.conn:
+            for placeholders, batch in in_batches(item_ids):
+                self.conn.execute(f"DELETE FROM chunks WHERE item_id IN ({placeholders})", batch)
+                self.conn.execute(f"DELETE FROM items WHERE id IN ({placeholders})", batch)
+
+    def latest_changed_date(self) -> Optional[str]:
+        """Latest System.ChangedDate in the ledger (ISO 8601 UTC strings sort chronologically)."""
+        (value,) = self.conn.execute("SELECT MAX(changed_date) FROM items").fetchone()
+        return value
+
+    def close(self) -> None:
+        self.conn.close()
@@ -1,14 +1,180 @@
-import json
 import os
+import time
 import chromadb
 from chromadb.utils import embedding_functions
+from embedding_cache import EmbeddingCache
+from metrics import METRICS, stage_report
+from profiling import profile_stage
+from records_io import iter_records
+from sync_state import SYNC_STATE_FILE, SyncState
+from workitem_details import PLACEHOLDER_EMBEDDING, get_details_collection
 
 INPUT_FILE = os.getenv("INPUT_FILE")
 CHROMA_DIR = os.getenv("CHROMA_DIR")
+UPSERT_BATCH_SIZE = int(os.getenv("UPSERT_BATCH_SIZE", "1000"))
+FULL_REBUILD = os.getenv("FULL_REBUILD") == "1"
+COLLECTION_NAME = "workitems"
+# Optional SQLite file of cached vectors, carried between workflow runs
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE")
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID", "onnx/all-MiniLM-L6-v2")
+# Ledger of written items and chunks, kept next to the Chroma database by default
+SYNC_STATE = os.getenv("SYNC_STATE") or (os.path.join(CHROMA_DIR, SYNC_STATE_FILE) if CHROMA_DIR else None)
 
 def load_cleaned_data(file_path):
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return iter_records(file_path)
+
+def _batches(records: list, size: int):
+    for i in range(0, len(records), size):
+        yield records[i:i+size]
+
+def _item_batches(records, size: int):
+    """
+    Group a stream of chunk records into lists of about size records without
+    splitting a work item's chunks across lists (clean_workitems emits each
+    item's chunks contiguously). A single item larger than size gets its own list.
+    """
+    batch, current_id = [], None
+    for rec in records:
+        if rec["id"] != current_id and len(batch) >= size:
+            yield batch
+            batch = []
+        current_id = rec["id"]
+        batch.append(rec)
+    if batch:
+        yield batch
+
+def record_id(rec: dict) -> str:
+    return f"{rec['id']}_{rec['chunk_index']}"
+
+def get_existing_metadata(collection, item_ids: list, state: SyncState = None, records: list = ()) -> dict:
+    """
+    Return {chunk id: metadata} for the stored chunks belonging to item_ids.
+    Items known to the sync state ledger are answered from it; only the
+    rest are looked up in Chroma. Chunks written before the workItemId
+    metadata existed are invisible to that lookup, so for items it finds
+    nothing for, the chunk ids produced for them in records are looked up
+    directly; diffing against those migrates the legacy chunks on the
+    first run.
+    """
+    existing = {}
+    if state is not None:
+        known = state.get_revs(item_ids)
+        existing.update(state.get_chunks(list(known)))
+        item_ids = [item_id for item_id in item_ids if item_id not in known]
+    if item_ids:
+        page = collection.get(where={"workItemId": {"$in": item_ids}}, include=["metadatas"])
+        existing.update(zip(page["ids"], page["metadatas"]))
+        found = {meta.get("workItemId") for meta in page["metadatas"] if meta}
+        unmatched = set(item_ids) - found
+        legacy_ids = [record_id(rec) for rec in records if rec["id"] in unmatched]
+        if legacy_ids:
+            page = collection.get(ids=legacy_ids, include=["metadatas"])
+            existing.update(zip(page["ids"], page["metadatas"]))
+    return existing
+
+def record_sync_state(state: SyncState, details: list, chunks: list) -> None:
+    """Replace the ledger entries of the items in a batch with what was just written."""
+    items = {rec["id"]: {"rev": rec.get("rev"), "changedDate": rec.get("changedDate")} for rec in details}
+    written = {item_id: {} for item_id in items}
+    for rec in chunks:
+        written.setdefault(rec["id"], {})[record_id(rec)] = rec["metadata"]
+    state.record_items(items, written)
+
+def iter_collection_ids(collection, batch_size: int):
+    """Yield every chunk id stored in the collection, one page at a time."""
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=batch_size, offset=offset)
+        yield from page["ids"]
+        if len(page["ids"]) < batch_size:
+            break
+        offset += batch_size
+
+def diff_records(records: list, existing: dict) -> tuple:
+    """
+    Compare cleaned records against the stored chunks using the contentHash
+    metadata written by clean_workitems.
+
+    Returns (to_upsert, to_update, to_delete):
+    - to_upsert: new chunks or chunks whose text changed (need embedding)
+    - to_update: same text but different metadata (no embedding needed)
+    - to_delete: stored chunk ids that are no longer produced
+    """
+    to_upsert, to_update = [], []
+    for rec in records:
+        stored = existing.get(record_id(rec))
+        content_hash = rec["metadata"].get("contentHash")
+        if stored is not None and stored.keys() - rec["metadata"].keys():
+            # Chroma merges metadata on write; None drops keys no longer produced
+            removed = {key: None for key in stored.keys() - rec["metadata"].keys()}
+            rec = dict(rec, metadata={**rec["metadata"], **removed})
+        if stored is None or not content_hash or stored.get("contentHash") != content_hash:
+            to_upsert.append(rec)
+        elif stored != rec["metadata"]:
+            to_update.append(rec)
+
+    current_ids = {record_id(rec) for rec in records}
+    to_delete = [chunk_id for chunk_id in existing if chunk_id not in current_ids]
+    return to_upsert, to_update, to_delete
+
+def delete_chunks(collection, chunk_ids: list, batch_size: int) -> int:
+    for batch in _batches(chunk_ids, batch_size):
+        with METRICS.timer("chroma_write_seconds", op="delete"):
+            collection.delete(ids=batch)
+    return len(chunk_ids)
+
+def update_metadata_in_batches(collection, records: list, batch_size: int) -> int:
+    """Update metadata only; documents and embeddings are left untouched."""
+    for batch in _batches(records, batch_size):
+        with METRICS.timer("chroma_write_seconds", op="update"):
+            collection.update(
+                ids=[record_id(rec) for rec in batch],
+                metadatas=[rec["metadata"] for rec in batch]
+            )
+    return len(records)
+
+def upsert_in_batches(collection, records: list, batch_size: int, cache: EmbeddingCache = None, embedding_func=None) -> int:
+    """
+    Upsert records in groups of batch_size so each group is embedded,
+    written and indexed in a single call instead of one call per chunk.
+    When a cache is given, vectors are looked up there first and only
+    uncached texts are passed to embedding_func. Embedding runs before the
+    upsert call rather than inside it, so the two are timed separately.
+    Returns the number of records upserted.
+    """
+    def _embed(texts):
+        with METRICS.timer("embedding_seconds"):
+            vectors = embedding_func(texts)
+        METRICS.incr("texts_embedded_total", len(texts))
+        return vectors
+
+    total = 0
+    for batch in _batches(records, batch_size):
+        documents = [rec["embedding_text"] for rec in batch]
+        embeddings = None
+        if embedding_func is not None:
+            embeddings = cache.embed(documents, _embed) if cache else _embed(documents)
+        with METRICS.timer("chroma_write_seconds", op="upsert"):
+            collection.upsert(
+                ids=[record_id(rec) for rec in batch],
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=[rec["metadata"] for rec in batch]
+            )
+        total += len(batch)
+        print(f"Upserted batch of {len(batch)} records ({total}/{len(records)})")
+    return total
+
+def upsert_details(details_collection, records: list, batch_size: int) -> int:
+    """Write the item-level details records emitted by clean_workitems, one entry per work item."""
+    for batch in _batches(records, batch_size):
+        with METRICS.timer("chroma_write_seconds", op="upsert_details"):
+            details_collection.upsert(
+                ids=[str(rec["id"]) for rec in batch],
+                embeddings=[PLACEHOLDER_EMBEDDING] * len(batch),
+                metadatas=[rec["details"] for rec in batch]
+            )
+    return len(records)
 
 def main():
     client = chromadb.PersistentClient(path=CHROMA_DIR)
@@ -16,23 +182,72 @@ def main():
     embedding_func = embedding_functions.DefaultEmbeddingFunction()
 
     collection = client.get_or_create_collection(
-        name="workitems",
+        name=COLLECTION_NAME,
         embedding_function=embedding_func
     )
+    details_collection = get_details_collection(client)
 
-    records = load_cleaned_data(INPUT_FILE)
+    # Never exceed what the client accepts in a single call
+    batch_size = max(1, min(UPSERT_BATCH_SIZE, client.get_max_batch_size()))
 
-    for rec in records:
-        rec_id = f"{rec['id']}_{rec['chunk_index']}"
-        collection.upsert(
-            documents=[rec["embedding_text"]],
-            metadatas=[rec["metadata"]],
-            ids=[rec_id]
-        )
-        print(f"Upserted record {rec_id}")
+    cache = EmbeddingCache(EMBEDDING_CACHE, EMBEDDING_MODEL_ID) if EMBEDDING_CACHE else None
+    state = SyncState(SYNC_STATE) if SYNC_STATE else None
+    # A full rebuild diffs against Chroma itself, so it also repairs a stale ledger
+    diff_state = None if FULL_REBUILD else state
+
+    # Stream the cleaned records a few work items at a time. Only chunks whose
+    # text changed are re-embedded; chunks that disappeared are deleted.
+    seen_ids, seen_items = set(), set()
+    total = uploaded = updated = deleted = 0
+    start = time.perf_counter()
+    for batch in _item_batches(load_cleaned_data(INPUT_FILE), batch_size):
+        item_ids = list(dict.fromkeys(rec["id"] for rec in batch))
+        details = [rec for rec in batch if "details" in rec]
+        batch = [rec for rec in batch if "details" not in rec]
+        upsert_details(details_collection, details, batch_size)
+        seen_items.update(str(rec["id"]) for rec in details)
+
+        existing = get_existing_metadata(collection, item_ids, diff_state, batch)
+        to_upsert, to_update, to_delete = diff_records(batch, existing)
+
+        deleted += delete_chunks(collection, to_delete, batch_size)
+        updated += update_metadata_in_batches(collection, to_update, batch_size)
+        uploaded += upsert_in_batches(collection, to_upsert, batch_size, cache, embedding_func)
+        # Committed after the writes, so an interrupted run resumes from here
+        if state:
+            record_sync_state(state, details, batch)
+        seen_ids.update(record_id(rec) for rec in batch)
+        total += len(batch)
+
+    # A full rebuild also removes chunks of items that are no longer exported
+    if FULL_REBUILD:
+        stale = [chunk_id for chunk_id in iter_collection_ids(collection, batch_size) if chunk_id not in seen_ids]
+        deleted += delete_chunks(collection, stale, batch_size)
+        stale_items = [item_id for item_id in iter_collection_ids(details_collection, batch_size) if item_id not in seen_items]
+        delete_chunks(details_collection, stale_items, batch_size)
+        if state:
+            state.remove_items(item_id for item_id in state.item_ids() if str(item_id) not in seen_items)
+    elapsed = time.perf_counter() - start
 
-    print(f"Uploaded {len(records)} records into Chroma collection 'workitems'")
+    rate = uploaded / elapsed if elapsed > 0 else 0.0
+    METRICS.incr("chunks_read_total", total)
+    METRICS.incr("chunks_embedded_total", uploaded)
+    METRICS.incr("chunks_metadata_updated_total", updated)
+    METRICS.incr("chunks_unchanged_total", total - uploaded - updated)
+    METRICS.incr("chunks_deleted_total", deleted)
+    print(f"{total} chunks read: {uploaded} embedded, {updated} metadata-only updates, "
+          f"{total - uploaded - updated} unchanged, {deleted} stale chunks deleted")
+    print(f"Uploaded {uploaded} records into Chroma collection '{COLLECTION_NAME}' "
+          f"in {elapsed:.1f}s ({rate:.1f} records/s, batch size {batch_size})")
+    if cache:
+        print(f"Embedding cache {EMBEDDING_CACHE}: {cache.hits} hits, {cache.misses} misses")
+        METRICS.incr("embedding_cache_hits_total", cache.hits)
+        METRICS.incr("embedding_cache_misses_total", cache.misses)
+        cache.close()
+    if state:
+        state.close()
 
 
 if __name__ == "__main__":
-    main()
+    with stage_report("upload"), profile_stage("upload"):
+        main()
@@ -0,0 +1,58 @@
+from typing import Dict, Iterable, List
+
+# Side collection holding item-level fields once per work item. Chunks in
+# the main collection reference it through their workItemId metadata.
+DETAILS_COLLECTION_NAME = "workitem_details"
+DETAIL_FIELDS = ("description", "acceptance_criteria")
+
+# Details are looked up by id only, so they get a constant one-dimensional
+# vector instead of a real embedding
+PLACEHOLDER_EMBEDDING = [0.0]
+
+
+def get_details_collection(client):
+    return client.get_or_create_collection(name=DETAILS_COLLECTION_NAME, embedding_function=None)
+
+
+def get_workitem_details(details_collection, item_ids: Iterable) -> Dict[int, dict]:
+    """Return {work item id: details metadata} for the given work item ids."""
+    ids = [str(i) for i in dict.fromkeys(item_ids) if i is not None]
+    if not ids:
+        return {}
+    page = details_collection.get(ids=ids, include=["metadatas"])
+    return {meta["workItemId"]: meta for meta in page["metadatas"] if meta}
+
+
+def resolve_details(details_collection, metadatas: List[dict]) -> List[dict]:
+    """
+    Return copies of chunk metadatas with the item-level fields
+    (description, acceptance_criteria) merged back in.
+    """
+    details = get_workitem_details(details_collection, (m.get("workItemId") for m in metadatas if m))
+    resolved = []
+    for meta in metadatas:
+        meta = dict(meta or {})
+        item = details.get(meta.get("workItemId"), {})
+        for field in DETAIL_FIELDS:
+            meta[field] = item.get(field, "")
+        resolved.append(meta)
+    return resolved
+
+
+def resolve_query_results(client, results: dict) -> dict:
+    """
+    Rehydrate the metadatas of a collection.query() or collection.get()
+    result in place, with a single lookup in the details collection.
+    """
+    metadatas = results.get("metadatas")
+    if not metadatas:
+        return results
+    details_collection = get_details_collection(client)
+    if isinstance(metadatas[0], list):
+        # query() returns one list of metadatas per query text
+        flat = [m for group in metadatas for m in group]
+        resolved = iter(resolve_details(details_collection, flat))
+        results["metadatas"] = [[next(resolved) for _ in group] for group in metadatas]
+    else:
+        results["metadatas"] = resolve_details(details_collection, metadatas)
+    return results